@@ -0,0 +1,111 @@
+"""
+Rules Benchmark
+===============
+
+Times the compiled screening rule plan (healthcare_pipeline.GapRulePlan) on
+a synthetic dataset as the rule count grows, up to GapRulePlan.MAX_RULES
+(32, one bit per rule in the uint32 care gap masks). The default rules are
+extended with labelled synthetic guideline variants that combine the same
+kinds of thresholds (age cut-offs, gender, diagnosis, due dates, visit and
+lab windows), like real guideline sets do, so every benchmarked rule set
+also runs in the pipeline. The compiled plan evaluates each distinct predicate
+and condition once for the whole set; the baseline compiles every rule on
+its own, i.e. one pass over the merged frame per rule, as hand-written
+per-rule branches would.
+
+Usage:
+    python benchmarks/rules_benchmark.py --patients 100k --rules 10,16,24,32
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..'))
+from healthcare_pipeline import DEFAULT_GAP_RULES, GapRulePlan, HealthcareDataProcessor
+from run_benchmarks import ensure_dataset
+
+
+def synthetic_rule_set(count, seed=0):
+    """DEFAULT_GAP_RULES plus synthetic variants of its rules, `count` rules in all."""
+    rng = np.random.default_rng(seed)
+    rule_set = copy.deepcopy(DEFAULT_GAP_RULES)
+    conditions = [rule['gap'] for rule in DEFAULT_GAP_RULES['rules']]
+    for i in range(count - len(rule_set['rules'])):
+        when = [['min_age', int(rng.choice([18, 40, 50, 65]))]]
+        if rng.random() < 0.5:
+            when.append(['gender', str(rng.choice(['F', 'M']))])
+        if rng.random() < 0.3:
+            when.append(['diagnosis', str(rng.choice(['diabetes', 'hypertension']))])
+        rule_set['rules'].append({'code': f'guideline_{i}', 'label': f'Guideline {i} overdue', 'weight': 1,
+                                  'when': when, 'gap': conditions[rng.integers(len(conditions))]})
+    rule_set['rules'] = rule_set['rules'][:count]
+    return rule_set
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', default='100k', help='synthetic dataset size, e.g. 10k, 1m')
+    parser.add_argument('--rules', default='10,16,24,32',
+                        help=f'comma-separated rule counts, at most {GapRulePlan.MAX_RULES}')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement (best is reported)')
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARK_DIR, 'data'))
+    parser.add_argument('--output', help='optional results JSON')
+    args = parser.parse_args()
+    counts = [int(count) for count in args.rules.split(',')]
+    if max(counts) > GapRulePlan.MAX_RULES:
+        parser.error(f'the pipeline accepts at most {GapRulePlan.MAX_RULES} rules')
+
+    dataset_dir = ensure_dataset(args.data_dir, args.patients)
+    print(f"Loading {dataset_dir}...")
+    processor = HealthcareDataProcessor()
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.load_data(data_dir=dataset_dir)
+        processor.clean_data()
+    merged_data = processor.patients_df.merge(processor.screening_df, on='patient_id', how='left')
+    today = datetime.now()
+    print(f"✓ {len(merged_data):,} merged patient rows\n")
+
+    def evaluate(plan):
+        return plan.evaluate(merged_data, today, processor.visit_index, processor.lab_index)
+
+    print(f"{'Rules':>6} {'Predicates':>11} {'Conditions':>11} {'Compiled (s)':>13} {'per rule (ms)':>14} "
+          f"{'Per-rule (s)':>13} {'Speedup':>8}")
+    results = []
+    for count in counts:
+        rule_set = synthetic_rule_set(count)
+        plan = GapRulePlan.compile(rule_set)
+        single_plans = [GapRulePlan.compile({'rules': [rule]}) for rule in rule_set['rules']]
+        compiled_s = best_time(lambda: evaluate(plan), args.repeat)
+        per_rule_s = best_time(lambda: [evaluate(single) for single in single_plans], args.repeat)
+        print(f"{count:>6} {len(plan.predicates):>11} {len(plan.conditions):>11} {compiled_s:>13.3f} "
+              f"{compiled_s / count * 1000:>14.2f} {per_rule_s:>13.3f} {per_rule_s / compiled_s:>7.1f}x")
+        results.append({'rules': count, 'predicates': len(plan.predicates), 'conditions': len(plan.conditions),
+                        'compiled_s': round(compiled_s, 4), 'per_rule_s': round(per_rule_s, 4)})
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'patients': len(merged_data), 'results': results}, f, indent=2)
+        print(f"\n✓ Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
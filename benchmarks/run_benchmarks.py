@@ -0,0 +1,137 @@
+"""
+Pipeline Benchmarks
+===================
+
+Times each HealthcareDataProcessor stage on synthetic datasets of several
+sizes and stores the results as JSON, so runs from different commits can be
+compared for regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 10k,1m
+    python benchmarks/run_benchmarks.py --sizes 10k --compare benchmarks/results/abc1234.json
+
+Datasets are generated once per size under --data-dir and reused afterwards.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..'))
+from healthcare_pipeline import HealthcareDataProcessor, StageProfiler
+from synthetic_data import generate_dataset, parse_size
+
+
+STAGES = ['load_data', 'clean_data', 'validate_data_quality', 'identify_care_gaps',
+          'generate_summary_report', 'export_results']
+
+
+def ensure_dataset(data_dir, size):
+    """Generate the dataset for `size` unless a complete one already exists."""
+    out_dir = os.path.join(data_dir, size)
+    marker = os.path.join(out_dir, '.complete')
+    if not os.path.exists(marker):
+        print(f"Generating {size} patient dataset in {out_dir}...")
+        counts = generate_dataset(out_dir, parse_size(size))
+        with open(marker, 'w') as f:
+            json.dump(counts, f)
+    return out_dir
+
+
+def benchmark_size(data_dir, size, stages):
+    """Run the stages on one dataset and return the stage measurements."""
+    dataset_dir = ensure_dataset(data_dir, size)
+    processor = HealthcareDataProcessor()
+    profiler = StageProfiler(processor)
+
+    cwd = os.getcwd()
+    os.chdir(dataset_dir)
+    try:
+        for stage in stages:
+            with contextlib.redirect_stdout(io.StringIO()), profiler.stage(stage):
+                getattr(processor, stage)()
+    finally:
+        os.chdir(cwd)
+
+    for stage in profiler.stages:
+        print(f"  {stage['stage']:<26} {stage['wall_s']:>9.3f}s  peak RSS {stage['peak_rss_mb']} MB")
+    return {'patients': parse_size(size), 'stages': profiler.stages}
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, baseline_path, threshold):
+    """Print wall-time ratios against a previous results file; return True if any regressed."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    print(f"\nComparison with {baseline['commit']} ({baseline_path}):")
+    print(f"{'Size':<6} {'Stage':<26} {'Before (s)':>10} {'After (s)':>10} {'Ratio':>7}")
+    regressed = False
+    for size, result in results['sizes'].items():
+        before = {stage['stage']: stage['wall_s'] for stage in baseline['sizes'].get(size, {}).get('stages', [])}
+        for stage in result['stages']:
+            if stage['stage'] not in before:
+                continue
+            # Sub-millisecond stages are compared against a 1 ms floor to avoid noise
+            ratio = max(stage['wall_s'], 0.001) / max(before[stage['stage']], 0.001)
+            flag = '  ⚠️ slower' if ratio > threshold else ''
+            regressed |= ratio > threshold
+            print(f"{size:<6} {stage['stage']:<26} {before[stage['stage']]:>10.3f} "
+                  f"{stage['wall_s']:>10.3f} {ratio:>6.2f}x{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10k', help='comma-separated patient counts, e.g. 10k,1m,10m')
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARK_DIR, 'data'))
+    parser.add_argument('--output', help='results JSON (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2, help='ratio reported as a regression')
+    parser.add_argument('--charts', action='store_true', help='also time create_visualizations')
+    args = parser.parse_args()
+
+    stages = STAGES[:]
+    if args.charts:
+        stages.insert(stages.index('export_results'), 'create_visualizations')
+
+    commit = current_commit()
+    results = {
+        'commit': commit,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'sizes': {},
+    }
+    for size in args.sizes.split(','):
+        print(f"\nBenchmarking {size} patients")
+        results['sizes'][size] = benchmark_size(args.data_dir, size, stages)
+
+    output = args.output or os.path.join(BENCHMARK_DIR, 'results', f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"\n✓ Results saved to '{output}'")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
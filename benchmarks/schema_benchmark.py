@@ -0,0 +1,69 @@
+"""
+Schema Benchmark
+================
+
+Compares reading visits.csv with pandas type inference (plus the date
+conversions clean_data used to do afterwards) against reading it with the
+declared schema in healthcare_pipeline.CSV_SCHEMAS.
+
+Usage:
+    python benchmarks/schema_benchmark.py              # 10M-row synthetic visits file
+    python benchmarks/schema_benchmark.py --rows 500000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from healthcare_pipeline import read_csv_with_schema
+from synthetic_data import write_synthetic_visits
+
+
+def read_inferred(path):
+    """Baseline: let pandas infer types, then convert dates one column at a time."""
+    df = pd.read_csv(path)
+    df['visit_date'] = pd.to_datetime(df['visit_date'], errors='coerce')
+    df['next_appointment'] = pd.to_datetime(df['next_appointment'], errors='coerce')
+    return df
+
+
+def measure(label, reader, path):
+    start = time.perf_counter()
+    df = reader(path)
+    elapsed = time.perf_counter() - start
+    memory_mb = df.memory_usage(deep=True).sum() / 1024 / 1024
+    print(f"{label:<22} {elapsed:>9.2f}s {memory_mb:>12.1f} MB")
+    return elapsed, memory_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000, help='rows in the synthetic visits file')
+    parser.add_argument('--keep', action='store_true', help='keep the generated CSV')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='schema_benchmark_')
+    path = os.path.join(tmp_dir, 'visits.csv')
+    print(f"Writing {args.rows:,} synthetic visits to {path}...")
+    write_synthetic_visits(path, args.rows)
+    print(f"File size: {os.path.getsize(path) / 1024 / 1024:.1f} MB\n")
+
+    print(f"{'Reader':<22} {'Parse time':>10} {'Memory':>15}")
+    inferred_time, inferred_mb = measure('inferred + to_datetime', read_inferred, path)
+    schema_time, schema_mb = measure('declared schema', read_csv_with_schema, path)
+
+    print(f"\nSpeedup: {inferred_time / schema_time:.1f}x, "
+          f"memory reduced {(1 - schema_mb / inferred_mb) * 100:.0f}%")
+
+    if not args.keep:
+        os.remove(path)
+        os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Care Gap Service Benchmark
+==========================
+
+Starts a CareGapService on a synthetic dataset and measures query latency
+from a local HTTP/1.1 keep-alive client: a cold pass (every patient_id seen
+for the first time, so the LRU cache misses) and a warm pass over the same
+ids (cache hits). In-process query() latency is reported alongside, to show
+how much of the time is HTTP overhead.
+
+Usage:
+    python benchmarks/service_benchmark.py --patients 100k --queries 5000
+"""
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..'))
+from healthcare_pipeline import CareGapService
+from run_benchmarks import ensure_dataset
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return {'p50_ms': round(float(np.percentile(ms, 50)), 3),
+            'p95_ms': round(float(np.percentile(ms, 95)), 3),
+            'p99_ms': round(float(np.percentile(ms, 99)), 3),
+            'max_ms': round(float(ms.max()), 3)}
+
+
+def time_http(connection, patient_ids):
+    samples = []
+    for patient_id in patient_ids:
+        start = time.perf_counter()
+        connection.request('GET', f'/care-gaps/{patient_id}')
+        response = connection.getresponse()
+        response.read()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def time_in_process(service, patient_ids):
+    samples = []
+    for patient_id in patient_ids:
+        start = time.perf_counter()
+        service.query(patient_id)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def print_row(label, samples):
+    stats = percentiles(samples)
+    print(f"{label:<28} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['p99_ms']:>9.3f} "
+          f"{stats['max_ms']:>9.3f}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', default='100k', help='synthetic dataset size, e.g. 10k, 1m')
+    parser.add_argument('--queries', type=int, default=5000, help='distinct patient_ids to query')
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARK_DIR, 'data'))
+    parser.add_argument('--output', help='optional results JSON')
+    args = parser.parse_args()
+
+    dataset_dir = ensure_dataset(args.data_dir, args.patients)
+    print(f"Loading {dataset_dir}...")
+    service = CareGapService(dataset_dir)
+    status = service.status()
+    print(f"✓ {status['patients']:,} patients loaded and evaluated in {service.reload_seconds:.2f}s")
+
+    rng = np.random.default_rng(0)
+    patient_ids = service.processor.patients_df['patient_id'].dropna().astype(str).to_numpy()
+    patient_ids = rng.choice(patient_ids, min(args.queries, len(patient_ids)), replace=False).tolist()
+
+    server = service.make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_port)
+
+    print(f"\n{len(patient_ids):,} queries")
+    print(f"{'Client':<28} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+    results = {
+        'patients': status['patients'],
+        'queries': len(patient_ids),
+        'load_s': service.reload_seconds,
+        'http_cold': print_row('HTTP, cache miss', time_http(connection, patient_ids)),
+        'http_warm': print_row('HTTP, cache hit', time_http(connection, patient_ids)),
+    }
+    service._cached_query.cache_clear()
+    results['in_process_cold'] = print_row('in-process, cache miss', time_in_process(service, patient_ids))
+    results['in_process_warm'] = print_row('in-process, cache hit', time_in_process(service, patient_ids))
+
+    start = time.perf_counter()
+    connection.request('POST', '/reload')
+    json.loads(connection.getresponse().read())
+    results['reload_s'] = round(time.perf_counter() - start, 3)
+    print(f"\nReload over HTTP: {results['reload_s']:.2f}s (cache invalidated)")
+
+    connection.close()
+    server.shutdown()
+    server.server_close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
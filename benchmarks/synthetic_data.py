@@ -0,0 +1,203 @@
+"""
+Synthetic Data Generator
+========================
+
+Writes patients.csv, visits.csv, screenings.csv and lab_results.csv with the
+same columns as the sample files, at any scale. Values follow simple but
+realistic distributions: an adult-skewed age curve, weighted diagnoses and
+visit types, a few visits and lab results per patient, and due dates spread
+around the reference date so that some screenings are overdue. A small
+fraction of records carry the data quality problems the pipeline cleans up
+(duplicate patients, lower-case gender codes, missing contact details).
+
+Usage:
+    python benchmarks/synthetic_data.py --patients 1000000 --out data_1m
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+DIAGNOSES = ['Hypertension', 'Type 2 Diabetes', 'High Cholesterol', 'Asthma', 'Depression',
+             'Anxiety', 'COPD', 'Arthritis', 'Osteoporosis', 'Back Pain', 'Migraine',
+             'Thyroid Disorder', 'Atrial Fibrillation', 'Sleep Apnea', 'Anemia']
+DIAGNOSIS_WEIGHTS = [0.20, 0.14, 0.12, 0.07, 0.07, 0.06, 0.04, 0.06, 0.03, 0.06, 0.04,
+                     0.04, 0.02, 0.03, 0.02]
+
+VISIT_TYPES = ['Follow-up', 'Annual Physical', 'Sick Visit', 'Mental Health', 'Cardiology',
+               'Urology', 'Gynecology', 'Physical Therapy', 'Pain Management', 'Sleep Study']
+VISIT_TYPE_WEIGHTS = [0.35, 0.25, 0.15, 0.06, 0.05, 0.03, 0.04, 0.03, 0.02, 0.02]
+
+# test type: (value mean, value std, high threshold, reference range)
+LAB_TESTS = {
+    'HbA1c': (6.6, 1.1, 7.0, '<7.0'),
+    'Glucose': (110, 30, 100, '70-100'),
+    'Cholesterol': (195, 35, 200, '<200'),
+    'TSH': (2.2, 1.0, 4.0, '0.4-4.0'),
+    'Vitamin D': (32, 12, 100, '30-100'),
+}
+LAB_TEST_WEIGHTS = [0.25, 0.25, 0.3, 0.1, 0.1]
+
+FIRST_NAMES = ['Jane', 'John', 'Maria', 'Robert', 'Lisa', 'Michael', 'Jennifer', 'David',
+               'Sarah', 'Christopher', 'Amanda', 'James', 'Michelle', 'Daniel', 'Emily']
+LAST_NAMES = ['Smith', 'Doe', 'Garcia', 'Johnson', 'Williams', 'Brown', 'Davis', 'Miller',
+              'Wilson', 'Moore', 'Taylor', 'Anderson', 'Thomas', 'Jackson', 'White']
+
+CHUNK_PATIENTS = 500_000
+
+
+def generate_dataset(out_dir, patients, seed=42, reference_date=None, noise=0.01):
+    """
+    Write all four CSVs for `patients` patients into out_dir.
+    Returns the row count written for each file.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    reference = np.datetime64((reference_date or datetime.now()).strftime('%Y-%m-%d'))
+    id_width = max(3, len(str(patients)))
+    counts = {'patients.csv': 0, 'visits.csv': 0, 'screenings.csv': 0, 'lab_results.csv': 0}
+
+    files = {name: open(os.path.join(out_dir, name), 'w') for name in counts}
+    try:
+        for start in range(0, patients, CHUNK_PATIENTS):
+            ids = np.arange(start + 1, min(start + CHUNK_PATIENTS, patients) + 1)
+            tables = _generate_chunk(rng, ids, id_width, reference, noise)
+            for name, df in tables.items():
+                df.to_csv(files[name], header=start == 0, index=False)
+                counts[name] += len(df)
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
+
+
+def write_synthetic_visits(path, rows, patients=None, seed=42):
+    """
+    Write a visits.csv with exactly `rows` visits spread over `patients` patients.
+    """
+    rng = np.random.default_rng(seed)
+    patients = patients or max(1, rows // 5)
+    reference = np.datetime64(datetime.now().strftime('%Y-%m-%d'))
+    id_width = max(3, len(str(patients)))
+
+    with open(path, 'w') as f:
+        for offset in range(0, rows, CHUNK_PATIENTS * 2):
+            n = min(CHUNK_PATIENTS * 2, rows - offset)
+            patient_ids = rng.integers(1, patients + 1, n)
+            visits = _visits(rng, patient_ids, id_width, reference)
+            visits.to_csv(f, header=offset == 0, index=False)
+
+
+def _generate_chunk(rng, ids, id_width, reference, noise):
+    n = len(ids)
+    patient_ids = _format_ids(ids, id_width)
+
+    age = np.clip(rng.normal(50, 18, n), 0, 100).astype(int)
+    gender = np.where(rng.random(n) < 0.51, 'F', 'M').astype(object)
+    diagnosis = rng.choice(DIAGNOSES, n, p=DIAGNOSIS_WEIGHTS)
+    first = rng.choice(FIRST_NAMES, n)
+    last = rng.choice(LAST_NAMES, n)
+    suffix = pd.Series(ids).astype(str).to_numpy()
+
+    patients = pd.DataFrame({
+        'patient_id': patient_ids,
+        'first_name': first,
+        'last_name': last,
+        'age': age,
+        'gender': gender,
+        'primary_diagnosis': diagnosis,
+        'phone': '555-' + pd.Series(rng.integers(0, 10000, n)).astype(str).str.zfill(4).to_numpy(),
+        'email': pd.Series(first).str.lower().to_numpy() + '.' + pd.Series(last).str.lower().to_numpy()
+                 + suffix + '@email.com',
+        'address': pd.Series(rng.integers(1, 9999, n)).astype(str).to_numpy() + ' Main St',
+    })
+
+    # Data quality noise: lower-case gender, missing contact details, duplicate rows
+    patients.loc[rng.random(n) < noise, 'gender'] = patients['gender'].str.lower()
+    patients.loc[rng.random(n) < noise, 'phone'] = None
+    patients.loc[rng.random(n) < noise, 'email'] = None
+    patients = pd.concat([patients, patients[rng.random(n) < noise / 2]], ignore_index=True)
+
+    visits_per_patient = rng.poisson(2.5, n)
+    visits = _visits(rng, np.repeat(ids, visits_per_patient), id_width, reference)
+
+    screenings = pd.DataFrame({
+        'patient_id': patient_ids,
+        'mammogram_due': _due_dates(rng, reference, n, blank=(gender != 'F') | (age < 40)),
+        'colonoscopy_due': _due_dates(rng, reference, n, blank=age < 45, spread_days=3650),
+        'flu_shot_due': _due_dates(rng, reference, n, spread_days=365),
+        'blood_pressure_check_due': _due_dates(rng, reference, n),
+        'cholesterol_check_due': _due_dates(rng, reference, n),
+        'diabetic_eye_exam_due': _due_dates(rng, reference, n, blank=diagnosis != 'Type 2 Diabetes'),
+    })
+
+    labs_per_patient = rng.poisson(1.5, n)
+    lab_ids = np.repeat(ids, labs_per_patient)
+    tests = list(LAB_TESTS)
+    params = np.array([LAB_TESTS[test][:3] for test in tests], dtype=float)
+    test_index = rng.choice(len(tests), len(lab_ids), p=LAB_TEST_WEIGHTS)
+    value = np.round(rng.normal(params[test_index, 0], params[test_index, 1]), 1)
+    lab_results = pd.DataFrame({
+        'patient_id': _format_ids(lab_ids, id_width),
+        'test_date': (reference - rng.integers(0, 730, len(lab_ids)).astype('timedelta64[D]')).astype(str),
+        'test_type': np.array(tests)[test_index],
+        'result_value': value,
+        'reference_range': np.array([LAB_TESTS[test][3] for test in tests])[test_index],
+        'status': np.where(value >= params[test_index, 2], 'High', 'Normal'),
+        'provider_notes': 'Routine monitoring',
+    })
+
+    return {'patients.csv': patients, 'visits.csv': visits,
+            'screenings.csv': screenings, 'lab_results.csv': lab_results}
+
+
+def _visits(rng, ids, id_width, reference):
+    n = len(ids)
+    visit_date = reference - rng.integers(0, 3 * 365, n).astype('timedelta64[D]')
+    return pd.DataFrame({
+        'patient_id': _format_ids(ids, id_width),
+        'visit_date': visit_date.astype(str),
+        'visit_type': rng.choice(VISIT_TYPES, n, p=VISIT_TYPE_WEIGHTS),
+        'provider': 'Dr. ' + rng.choice(LAST_NAMES, n),
+        'notes': 'Routine visit',
+        'next_appointment': (visit_date + rng.integers(30, 365, n).astype('timedelta64[D]')).astype(str),
+    })
+
+
+def _due_dates(rng, reference, n, blank=None, spread_days=730):
+    due = (reference + rng.integers(-spread_days // 2, spread_days, n).astype('timedelta64[D]')).astype(str)
+    due = due.astype(object)
+    if blank is not None:
+        due[blank] = None
+    return due
+
+
+def _format_ids(ids, width):
+    return 'P' + pd.Series(ids).astype(str).str.zfill(width).to_numpy()
+
+
+def parse_size(text):
+    """Parse patient counts such as '10k', '1m' or '2500'."""
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', default='10k', help='number of patients, e.g. 10k, 1m, 10m')
+    parser.add_argument('--out', required=True, help='output directory')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    counts = generate_dataset(args.out, parse_size(args.patients), seed=args.seed)
+    for name, count in counts.items():
+        print(f"✓ {name}: {count:,} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,27 +9,241 @@ Author: [Your Name]
 Date: [Current Date]
 """
 
+import argparse
+import contextlib
+import cProfile
+import functools
+import gzip
+import hashlib
+import io
+import json
+import os
+import pstats
+import re
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = feather = pq = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Care gap types in the order they are listed for each patient:
+# (code, report label, priority weight). Overdue gaps weigh 2, needed gaps 1.
+CARE_GAP_TYPES = [
+    ('mammogram', 'Mammogram overdue', 2),
+    ('colonoscopy', 'Colonoscopy overdue', 2),
+    ('annual_visit', 'Annual visit overdue', 2),
+    ('flu_shot', 'Flu shot needed', 1),
+    ('blood_pressure_check', 'Blood pressure check overdue', 2),
+    ('cholesterol_check', 'Cholesterol check overdue', 2),
+    ('diabetic_eye_exam', 'Diabetic eye exam overdue', 2),
+    ('hba1c_test', 'HbA1c test overdue', 2),
+    ('hba1c_control', 'HbA1c above target', 2),
+    ('glucose_control', 'Glucose above target', 1),
+]
+
+# Columns of the care gaps report, and the file extension of each export format
+REPORT_COLUMNS = ['patient_id', 'name', 'age', 'gender', 'phone', 'email', 'care_gaps', 'priority']
+EXPORT_FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet', 'ndjson': '.ndjson'}
+DEFAULT_EXPORT_CHUNK_ROWS = 100_000
+
+# Priority levels; a care gap's priority is stored as the index into this list
+PRIORITY_LEVELS = ['High', 'Medium', 'Low']
+
+# Age groups of the summary aggregates, split at the ages the screening rules use
+AGE_GROUP_BOUNDS = [18, 40, 50, 65]
+AGE_GROUP_LABELS = ['0-17', '18-39', '40-49', '50-64', '65+']
+
+# Lab tests with result-driven rules, and the value at or above which a result
+# counts as out of target when the lab reported no status
+LAB_RULE_TARGETS = {'HbA1c': 7.0, 'Glucose': 100.0}
+OUT_OF_TARGET_STATUSES = ['High', 'Critical']
+HBA1C_TEST_INTERVAL_DAYS = 182
+# Primary diagnoses that get the diabetic care gaps. Listed explicitly, since
+# "Prediabetes" and "Diabetes insipidus" also contain the word diabetes
+DIABETES_DIAGNOSES = ['Diabetes', 'Diabetes Mellitus', 'Type 1 Diabetes', 'Type 2 Diabetes',
+                      'Type 1 Diabetes Mellitus', 'Type 2 Diabetes Mellitus']
+
+# Screening guidelines as data, compiled by GapRulePlan: one rule per gap type.
+# A patient is eligible for a rule when all of its 'when' predicates hold, and
+# has the gap when its 'gap' condition holds as well.
+#   predicates: ['min_age', years], ['max_age', years], ['gender', code],
+#               ['diagnosis', word or phrase] (whole words, any case) or
+#               ['diagnosis', [diagnosis, ...]] (whole diagnosis, any case)
+#   conditions: ['due', column] (due date passed or missing), ['no_visit_within', days],
+#               ['no_lab_within', test, days], ['lab_out_of_target', test, target (optional)]
+# Ages and days are integers; term names, arity and argument types, due date
+# columns and lab tests are all checked when the rule set is compiled.
+# A rule's 'label' and 'weight' override those of its CARE_GAP_TYPES entry, and
+# rules for new gap types must give both. A rule set has at most 32 rules,
+# since care gaps are stored as uint32 bitmasks. Patients aged senior_age or
+# older get one extra priority point per gap.
+DEFAULT_GAP_RULES = {
+    'senior_age': 65,
+    'rules': [
+        {'code': 'mammogram', 'when': [['gender', 'F'], ['min_age', 40]], 'gap': ['due', 'mammogram_due']},
+        {'code': 'colonoscopy', 'when': [['min_age', 50]], 'gap': ['due', 'colonoscopy_due']},
+        {'code': 'annual_visit', 'when': [], 'gap': ['no_visit_within', 365]},
+        {'code': 'flu_shot', 'when': [], 'gap': ['due', 'flu_shot_due']},
+        {'code': 'blood_pressure_check', 'when': [['min_age', 18]], 'gap': ['due', 'blood_pressure_check_due']},
+        {'code': 'cholesterol_check', 'when': [['min_age', 40]], 'gap': ['due', 'cholesterol_check_due']},
+        {'code': 'diabetic_eye_exam', 'when': [['diagnosis', DIABETES_DIAGNOSES]],
+         'gap': ['due', 'diabetic_eye_exam_due']},
+        {'code': 'hba1c_test', 'when': [['diagnosis', DIABETES_DIAGNOSES]],
+         'gap': ['no_lab_within', 'HbA1c', HBA1C_TEST_INTERVAL_DAYS]},
+        {'code': 'hba1c_control', 'when': [['diagnosis', DIABETES_DIAGNOSES]], 'gap': ['lab_out_of_target', 'HbA1c']},
+        {'code': 'glucose_control', 'when': [['diagnosis', DIABETES_DIAGNOSES]],
+         'gap': ['lab_out_of_target', 'Glucose']},
+    ],
+}
+
+# Default memory ceiling for streaming ingestion of the visits and lab extracts
+DEFAULT_STREAM_MEMORY_MB = 512
+
+# Source CSV files, and where cleaned copies of them are cached between runs
+SOURCE_FILES = ['patients.csv', 'visits.csv', 'screenings.csv', 'lab_results.csv']
+DEFAULT_CACHE_DIR = '.pipeline_cache'
+
+# Resumable runs (see StageCheckpoints): each pipeline stage in run order, the
+# stages whose outputs it reads, and the processor attributes it checkpoints
+DEFAULT_CHECKPOINT_DIR = '.pipeline_checkpoints'
+PIPELINE_STAGES = {
+    'clean_data': ([], ['patients_df', 'visits_df', 'screening_df', 'lab_results_df', 'visit_index',
+                        'lab_timeline', 'lab_index', 'latest_lab_results', 'patient_id_map',
+                        'streamed_row_counts', 'streamed_validation']),
+    'validate_data_quality': (['clean_data'], ['data_quality_counts', 'data_quality_issues',
+                                               'validation_issues']),
+    'identify_care_gaps': (['clean_data'], ['care_gaps', 'gap_aggregates', 'gaps_evaluated_at']),
+    'save_gap_state': (['clean_data', 'validate_data_quality', 'identify_care_gaps'], []),
+    'save_patient_store': (['clean_data'], []),
+    'generate_summary_report': (['clean_data', 'validate_data_quality', 'identify_care_gaps'], []),
+    'create_visualizations': (['clean_data', 'identify_care_gaps'], []),
+    'export_results': (['clean_data', 'validate_data_quality', 'identify_care_gaps'], []),
+}
+
+# Where save_patient_store writes the per-patient lookup store
+DEFAULT_PATIENT_STORE_DIR = 'patient_store'
+
+# Care gap query service (see CareGapService)
+DEFAULT_SERVICE_HOST = '127.0.0.1'
+DEFAULT_SERVICE_PORT = 8765
+DEFAULT_SERVICE_CACHE_SIZE = 10_000
+
+# Data quality rules per table; bit i of a row's issue mask is rule i.
+# Patient issues keep their original report wording.
+DATA_QUALITY_RULES = {
+    'patients': ['Missing patient IDs', 'Invalid ages (negative or >120)', 'Invalid gender codes',
+                 'Missing phone numbers', 'Missing email addresses',
+                 'Invalid phone numbers', 'Invalid email addresses'],
+    'visits': ['Missing patient IDs', 'Unknown patient IDs', 'Missing or invalid visit dates',
+               'Next appointment before visit date'],
+    'screenings': ['Missing patient IDs', 'Unknown patient IDs', 'Duplicate screening records'],
+    'lab_results': ['Missing patient IDs', 'Unknown patient IDs', 'Missing or invalid test dates',
+                    'Missing result values'],
+}
+TABLE_ATTRIBUTES = {'patients': 'patients_df', 'visits': 'visits_df',
+                    'screenings': 'screening_df', 'lab_results': 'lab_results_df'}
+
+# Care gap chart written by create_visualizations
+CHART_PATH = 'care_gaps_chart.png'
+
+# Summary aggregates table written by export_results
+SUMMARY_EXPORT_PATH = 'care_gap_summary.csv'
+
+# Record linkage (see link_patient_records): each record is compared with the
+# next LINKAGE_WINDOW records of the same blocking key, so comparisons grow
+# linearly with the number of patients even for very common names
+LINKAGE_WINDOW = 5
+LINKAGE_BLOCKING_KEYS = ['phone', 'email', 'name']
+STREET_TYPE_PATTERN = r'\b(?:street|st|avenue|ave|road|rd|drive|dr|lane|ln|boulevard|blvd|court|ct|place|pl)\b'
+
+# Per-patient gap state kept between runs for incremental (delta) updates
+DEFAULT_STATE_PATH = 'care_gap_state.pkl'
+
+# Declared column types for each source CSV. Low-cardinality text is read as
+# categorical, ages as a compact nullable integer, and date columns are parsed
+# during the read with a fixed ISO format instead of per-column inference.
+# Values that do not match the format are left as text and coerced in clean_data.
+ISO_DATE_FORMAT = '%Y-%m-%d'
+CSV_SCHEMAS = {
+    'patients.csv': {
+        'dtype': {'patient_id': str, 'first_name': str, 'last_name': str, 'age': 'Int16',
+                  'gender': 'category', 'primary_diagnosis': 'category',
+                  'phone': str, 'email': str, 'address': str},
+        'dates': [],
+    },
+    'visits.csv': {
+        'dtype': {'patient_id': 'category', 'visit_type': 'category',
+                  'provider': 'category', 'notes': str},
+        'dates': ['visit_date', 'next_appointment'],
+    },
+    'screenings.csv': {
+        'dtype': {'patient_id': str},
+        'dates': ['mammogram_due', 'colonoscopy_due', 'flu_shot_due', 'blood_pressure_check_due',
+                  'cholesterol_check_due', 'diabetic_eye_exam_due'],
+    },
+    'lab_results.csv': {
+        'dtype': {'patient_id': 'category', 'test_type': 'category', 'result_value': str,
+                  'reference_range': 'category', 'status': 'category', 'provider_notes': str},
+        'dates': ['test_date'],
+    },
+}
+
 class HealthcareDataProcessor:
     """
     Main class for processing healthcare data and identifying care gaps.
     """
     
-    def __init__(self):
-        """Initialize the processor with empty data containers."""
+    def __init__(self, gap_rules=None):
+        """
+        Initialize the processor with empty data containers. gap_rules is a
+        compiled GapRulePlan (see GapRulePlan.load), DEFAULT_GAP_RULES by default.
+        """
+        self.gap_rules = gap_rules or GapRulePlan.compile(DEFAULT_GAP_RULES)
         self.patients_df = None
         self.visits_df = None
         self.screening_df = None
         self.lab_results_df = None
-        self.care_gaps = []
+        self.care_gaps = CareGapStore()
+        self.gap_matrix = None
+        self.gap_aggregates = None
+        self.gaps_evaluated_at = None
+        self.visit_index = None
+        self.lab_timeline = None
+        self.lab_index = None
+        self.latest_lab_results = None
+        self.streamed_row_counts = {}
+        self.streamed_validation = {}
+        self.load_timings = {}
+        self.patient_store = None
+        self.patient_id_map = pd.Series(dtype=object)
+        self.data_quality_counts = {}
         self.data_quality_issues = []
+        self.validation_issues = None
+        self.run_profile = None
+        self.chart_future = None
+        self._chart_pool = None
     
-    def load_data(self):
+    def load_data(self, streaming=False, memory_limit_mb=DEFAULT_STREAM_MEMORY_MB, max_workers=None,
+                  data_dir='.'):
         """
         Load all CSV files into pandas DataFrames.
         
@@ -38,30 +252,119 @@ class HealthcareDataProcessor:
         - visits.csv  
         - screening_due.csv
         - lab_results.csv
+        
+        The files are independent, so they are read concurrently on a thread
+        pool (max_workers threads, one per file by default); the pandas C
+        parser releases the GIL for most of a read. Each file's load time is
+        kept in self.load_timings. If any source file is missing, nothing is
+        read and FileNotFoundError names every missing file.
+        
+        With streaming=True, visits.csv and lab_results.csv are never held in
+        memory: they are read in chunks sized to stay under memory_limit_mb and
+        folded into the per-patient visit index and latest lab results.
+        Streamed chunks are validated against the patient list, so they start
+        once patients.csv is loaded. Files are read from data_dir.
         """
         print("Loading healthcare data files...")
         
-        try:
-            # TODO: Load patients.csv into self.patients_df
-            # Hint: Use pd.read_csv() function
-            self.patients_df = pd.read_csv('patients.csv')
-            
-            # TODO: Load visits.csv into self.visits_df
-            self.visits_df = pd.read_csv('visits.csv')
-            
-            # TODO: Load screening_due.csv into self.screening_df
-            self.screening_df = pd.read_csv('screenings.csv')
-            
-            # TODO: Load lab_results.csv into self.lab_results_df
-            self.lab_results_df = pd.read_csv('lab_results.csv')
+        paths = {name: os.path.join(data_dir, name) for name in SOURCE_FILES}
+        missing = [name for name, path in paths.items() if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(
+                f"Missing source file(s): {', '.join(missing)}. "
+                "Make sure all CSV files are in the same directory as this script."
+            )
+        
+        self.load_timings = {}
+        with ThreadPoolExecutor(max_workers=max_workers or len(SOURCE_FILES)) as pool:
+            patients = pool.submit(self._timed_load, 'patients.csv', read_csv_with_schema,
+                                   paths['patients.csv'])
+            screenings = pool.submit(self._timed_load, 'screenings.csv', read_csv_with_schema,
+                                     paths['screenings.csv'])
+            if streaming:
+                self.patients_df = patients.result()
+                visits = pool.submit(self._timed_load, 'visits.csv', self._stream_visits,
+                                     paths['visits.csv'], memory_limit_mb)
+                lab_results = pool.submit(self._timed_load, 'lab_results.csv', self._stream_lab_results,
+                                          paths['lab_results.csv'], memory_limit_mb)
+            else:
+                visits = pool.submit(self._timed_load, 'visits.csv', read_csv_with_schema, paths['visits.csv'])
+                lab_results = pool.submit(self._timed_load, 'lab_results.csv', read_csv_with_schema,
+                                          paths['lab_results.csv'])
             
+            self.patients_df = patients.result()
+            self.screening_df = screenings.result()
+            if streaming:
+                visits.result()
+                lab_results.result()
+            else:
+                self.visits_df = visits.result()
+                self.lab_results_df = lab_results.result()
+        
+        for path in SOURCE_FILES:
+            print(f"   {path:<18} {self.load_timings[path]:>8.3f}s")
+        if streaming:
+            print(f"✓ All data files loaded successfully! (streamed visits and lab results, "
+                  f"{memory_limit_mb} MB limit)")
+        else:
             print("✓ All data files loaded successfully!")
+    
+    def _timed_load(self, path, reader, *args):
+        """Run one file's reader on a loader thread, recording its wall time."""
+        start = time.perf_counter()
+        try:
+            return reader(*args)
+        finally:
+            self.load_timings[path] = round(time.perf_counter() - start, 4)
+    
+    def _stream_visits(self, path, memory_limit_mb):
+        """
+        Fold visits.csv chunk by chunk into the per-patient visit index.
+        Chunks are validated as they stream, since the rows are not kept.
+        """
+        self.visits_df = None
+        self.visit_index = None
+        visit_count = 0
+        validation = []
+        
+        for chunk in read_csv_with_schema(path, chunksize=_chunk_rows(path, memory_limit_mb)):
+            visit_count += len(chunk)
+            chunk['visit_date'] = pd.to_datetime(chunk['visit_date'], errors='coerce')
+            chunk['next_appointment'] = pd.to_datetime(chunk['next_appointment'], errors='coerce')
+            validation.append(self._validate_table('visits', chunk))
+            
+            partial = _aggregate_visits(chunk)
+            if self.visit_index is None:
+                self.visit_index = partial
+            else:
+                self.visit_index = _combine_visit_aggregates(self.visit_index, partial)
+        
+        if self.visit_index is None:
+            self.visit_index = _aggregate_visits(read_csv_with_schema(path, nrows=0))
+        self.streamed_row_counts['visits'] = visit_count
+        self.streamed_validation['visits'] = _sum_validation(validation)
+    
+    def _stream_lab_results(self, path, memory_limit_mb):
+        """
+        Fold lab_results.csv chunk by chunk into the latest result per patient and test.
+        Chunks are validated as they stream, since the rows are not kept.
+        """
+        self.lab_results_df = None
+        latest = None
+        lab_count = 0
+        validation = []
+        
+        for chunk in read_csv_with_schema(path, chunksize=_chunk_rows(path, memory_limit_mb)):
+            lab_count += len(chunk)
+            chunk['test_date'] = pd.to_datetime(chunk['test_date'], errors='coerce')
+            validation.append(self._validate_table('lab_results', chunk))
             
-        except FileNotFoundError as e:
-            print(f"❌ Error loading file: {e}")
-            print("Make sure all CSV files are in the same directory as this script.")
-        except Exception as e:
-            print(f"❌ Unexpected error: {e}")
+            partial = _latest_lab_results(chunk)
+            latest = partial if latest is None else _latest_lab_results(pd.concat([latest, partial]))
+        
+        self.latest_lab_results = latest
+        self.streamed_row_counts['lab_results'] = lab_count
+        self.streamed_validation['lab_results'] = _sum_validation(validation)
     
     def explore_data(self):
         """
@@ -77,13 +380,13 @@ class HealthcareDataProcessor:
         print(f"Number of patients: {len(self.patients_df)}")
         
         # TODO: Print the number of visits
-        print(f"Number of visits: {len(self.visits_df)}")
+        print(f"Number of visits: {self._row_count(self.visits_df, 'visits')}")
         
         # TODO: Print the number of screening records
         print(f"Number of screening records: {len(self.screening_df)}")
         
         # TODO: Print the number of lab results
-        print(f"Number of lab results: {len(self.lab_results_df)}")
+        print(f"Number of lab results: {self._row_count(self.lab_results_df, 'lab_results')}")
         
         print("\nPatients Dataset:")
         # TODO: Display first 3 rows of patients data
@@ -107,6 +410,49 @@ class HealthcareDataProcessor:
         # Show unique diagnoses
         print("\nUnique Diagnoses:")
         print(self.patients_df['primary_diagnosis'].unique())
+    
+    def _load_and_clean(self, profiler, cache, streaming, memory_limit_mb, workers, as_of):
+        """
+        Steps 1-3 of run_full_analysis; with workers > 1 also steps 4 and 5, on shards.
+        """
+        # Step 1: Load data
+        with profiler.stage('load_data'):
+            cache_hit = cache is not None and cache.load(self)
+            if not cache_hit:
+                self.load_data(streaming=streaming, memory_limit_mb=memory_limit_mb)
+        
+        # Step 2: Explore data
+        with profiler.stage('explore_data'):
+            self.explore_data()
+        
+        if workers > 1:
+            # Steps 3-5: Clean, validate and identify care gaps per shard
+            with profiler.stage('run_sharded'):
+                self.run_sharded(workers, as_of)
+            return
+        
+        # Step 3: Clean data
+        with profiler.stage('clean_data'):
+            if cache_hit:
+                self.build_visit_index()
+                self.build_lab_index()
+            else:
+                self.clean_data()
+                if cache is not None:
+                    cache.save(self)
+    
+    def _row_count(self, df, name):
+        """Row count of a loaded table, or of the rows streamed for it."""
+        if df is None:
+            return self.streamed_row_counts.get(name, 0)
+        return len(df)
+    
+    def row_counts(self):
+        """Current row counts of the source tables and the care gap results."""
+        counts = {table: self._row_count(getattr(self, attribute), table)
+                  for table, attribute in TABLE_ATTRIBUTES.items()}
+        counts['care_gaps'] = len(self.care_gaps)
+        return counts
         
     def clean_data(self):
         """
@@ -130,22 +476,176 @@ class HealthcareDataProcessor:
         # TODO: Standardize gender codes to 'M' and 'F'
         # Hint: Use str.upper() method
         self.patients_df['gender'] = self.patients_df['gender'].str.upper()
+        self.patients_df['phone'] = normalize_phone_numbers(self.patients_df['phone'])
         
         # TODO: Convert date columns to datetime format
         # For visits_df: convert 'visit_date' and 'next_appointment' columns
         # For screening_df: convert all date columns (they end with '_due')
         # Hint: Use pd.to_datetime() with errors='coerce' to handle invalid dates
-        if 'visit_date' in self.visits_df.columns:
-            self.visits_df['visit_date'] = pd.to_datetime(self.visits_df['visit_date'], errors='coerce')
-        if 'next_appointment' in self.visits_df.columns:
-            self.visits_df['next_appointment'] = pd.to_datetime(self.visits_df['next_appointment'], errors='coerce')
+        # Streamed visits were already converted and folded into the visit index
+        if self.visits_df is not None:
+            if 'visit_date' in self.visits_df.columns:
+                self.visits_df['visit_date'] = pd.to_datetime(self.visits_df['visit_date'], errors='coerce')
+            if 'next_appointment' in self.visits_df.columns:
+                self.visits_df['next_appointment'] = pd.to_datetime(self.visits_df['next_appointment'], errors='coerce')
         
         date_columns = [col for col in self.screening_df.columns if col.endswith('_due')]
         for col in date_columns:
             self.screening_df[col] = pd.to_datetime(self.screening_df[col], errors='coerce')
         
+        if self.lab_results_df is not None:
+            self.lab_results_df['test_date'] = pd.to_datetime(self.lab_results_df['test_date'], errors='coerce')
+        
+        # Merge records of the same person filed under different patient_ids
+        self.link_patient_records()
+        
+        # Visit history and lab rules read from per-patient indexes built from the cleaned data
+        if self.visits_df is not None:
+            self.build_visit_index()
+        self.build_lab_index()
+        
         print("✓ Data cleaning completed!")
     
+    def link_patient_records(self):
+        """
+        Find records of the same person under different patient_ids and merge them.
+        
+        Candidates come from three blocking keys: normalized phone, email, and
+        last name plus first initial. Records are sorted by each key and compared
+        only with the next LINKAGE_WINDOW records that share it, on integer codes
+        of the normalized fields. A pair matches when last name and first initial
+        agree, the first names are the same or one is a shortened form of the
+        other (Jon, Jonathan), age (within a year) and gender do not conflict,
+        and either two of phone, email and address agree or the email and first
+        name do. Siblings sharing a phone and address therefore stay apart. Matches
+        are grouped transitively and the first record of each group in file
+        order keeps its patient_id.
+        
+        The other records are dropped from patients_df and their patient_ids are
+        rewritten to the canonical id in visits, screenings and lab results (or
+        the visit index and latest lab results of a streamed run). A merged
+        patient keeps one screening row, with the latest of each due date.
+        Returns the duplicate -> canonical patient_id mapping, also kept as
+        patient_id_map.
+        """
+        patients = self.patients_df
+        first_rows = patients['patient_id'].notna() & ~patients['patient_id'].duplicated()
+        records = patients[first_rows.to_numpy()]
+        canonical = _link_records(_linkage_codes(records))
+        
+        patient_ids = records['patient_id'].to_numpy(dtype=object)
+        duplicates = canonical != np.arange(len(records))
+        patient_id_map = pd.Series(patient_ids[canonical[duplicates]], index=pd.Index(patient_ids[duplicates]),
+                                   name='canonical_patient_id')
+        self.patient_id_map = patient_id_map
+        
+        if len(patient_id_map):
+            self.patients_df = patients[~patients['patient_id'].isin(patient_id_map.index)]
+            for table in ['visits_df', 'screening_df', 'lab_results_df', 'latest_lab_results']:
+                if getattr(self, table) is not None:
+                    setattr(self, table, _remap_patient_ids(getattr(self, table), patient_id_map))
+            self.screening_df = _merge_linked_screenings(self.screening_df, patient_id_map.unique())
+            if self.latest_lab_results is not None:
+                self.latest_lab_results = _latest_lab_results(self.latest_lab_results)
+            if self.visits_df is None and self.visit_index is not None:
+                linked = self.visit_index.set_axis(_canonical_ids(self.visit_index.index, patient_id_map))
+                self.visit_index = _combine_visit_aggregates(linked.iloc[:0], linked)
+        
+        print(f"Linked {len(patient_id_map)} patient records to "
+              f"{patient_id_map.nunique()} patients under another patient_id")
+        return patient_id_map
+    
+    def build_visit_index(self):
+        """
+        Build the per-patient visit index in a single groupby pass over visits_df.
+        
+        Columns: last_visit_date, visit_count, next_appointment (latest scheduled)
+        and last_visit_type (type of the most recent dated visit), indexed by patient_id.
+        last_visit_type_date records which visit supplied last_visit_type, so new
+        visits can be folded into the index later without rescanning visits_df.
+        """
+        self.visit_index = _aggregate_visits(self.visits_df)
+        return self.visit_index
+    
+    def build_lab_index(self):
+        """
+        Build the per-patient lab timeline and the latest-result lookups.
+        
+        lab_timeline holds every result sorted by patient_id and test_date, so one
+        patient's history is a contiguous slice (see lab_history). lab_index has
+        one row per patient with the latest date, value and status of each test
+        in LAB_RULE_TARGETS, from a single sort-and-deduplicate pass. Streamed
+        runs only keep the latest results, so they have no timeline.
+        """
+        if self.lab_results_df is not None:
+            labs = self.lab_results_df.dropna(subset=['patient_id'])
+            labs = labs.assign(patient_id=labs['patient_id'].astype(str))
+            self.lab_timeline = labs.sort_values(['patient_id', 'test_date'], kind='stable',
+                                                 ignore_index=True)
+            latest = _latest_lab_results(self.lab_timeline)
+        else:
+            self.lab_timeline = None
+            latest = self.latest_lab_results
+        
+        self.lab_index = _wide_lab_index(latest)
+        return self.lab_index
+    
+    def lab_history(self, patient_id):
+        """
+        All lab results of one patient in date order, as a slice of lab_timeline.
+        """
+        patient_ids = self.lab_timeline['patient_id'].to_numpy()
+        start = np.searchsorted(patient_ids, patient_id, side='left')
+        stop = np.searchsorted(patient_ids, patient_id, side='right')
+        return self.lab_timeline.iloc[start:stop]
+    
+    def save_patient_store(self, store_dir=DEFAULT_PATIENT_STORE_DIR):
+        """
+        Write the cleaned tables to a PatientStore for evaluate_patients.
+        Needs the in-memory visits and lab results (not a streamed run).
+        """
+        if self.visits_df is None or self.lab_results_df is None:
+            raise ValueError("save_patient_store needs visits_df and lab_results_df; "
+                             "streamed runs do not keep them")
+        if not (pd.api.types.is_datetime64_any_dtype(self.visits_df['visit_date'])
+                and pd.api.types.is_datetime64_any_dtype(self.lab_results_df['test_date'])):
+            raise ValueError("save_patient_store needs the cleaned tables; run clean_data first")
+        PatientStore.write(store_dir, {table: getattr(self, table) for table in PatientStore.TABLES},
+                           self.patient_id_map)
+        print(f"✓ Patient store saved to '{store_dir}'")
+    
+    def evaluate_patients(self, patient_ids, store_dir=DEFAULT_PATIENT_STORE_DIR, as_of=None):
+        """
+        Evaluate care gaps for one patient or a few, without loading the CSVs.
+        
+        Each patient's rows are sliced out of the memory-mapped PatientStore
+        (opened once and kept on the processor) and run through the same rules
+        as identify_care_gaps, as of now or as_of. Returns one record per
+        patient found, in the care_gaps record layout; patients without gaps
+        have an empty gaps list. The patient_id of a linked duplicate resolves
+        to its canonical patient, whose record is returned.
+        """
+        if isinstance(patient_ids, str):
+            patient_ids = [patient_ids]
+        if self.patient_store is None or self.patient_store.store_dir != store_dir:
+            self.patient_store = PatientStore(store_dir)
+        patient_ids = _canonical_ids(list(patient_ids), self.patient_store.patient_id_map)
+        
+        subset = HealthcareDataProcessor(self.gap_rules)
+        for table, df in self.patient_store.lookup(patient_ids).items():
+            setattr(subset, table, df)
+        subset.build_visit_index()
+        subset.build_lab_index()
+        
+        patients = subset.patients_df.assign(_row=subset.patients_df.index)
+        merged_data = patients.merge(subset.screening_df, on='patient_id', how='left')
+        today = datetime.now() if as_of is None else _as_of_datetime(as_of)
+        gap_matrix = subset._evaluate_gap_rules(merged_data, today, *subset._indexes_as_of(as_of))
+        priorities = subset._calculate_priorities(gap_matrix, merged_data['age'])
+        results = CareGapStore(merged_data['_row'].to_numpy(), _gap_masks(gap_matrix), priorities,
+                               subset.gap_rules.gap_types)
+        return results.records(subset.patients_df)
+    
     def validate_data_quality(self):
         """
         Check for data quality issues and report them.
@@ -154,39 +654,129 @@ class HealthcareDataProcessor:
         print("DATA QUALITY VALIDATION")
         print("="*50)
         
-        self.data_quality_issues = []
+        counts_list, issue_frames = [], []
+        for table, df in [('patients', self.patients_df), ('visits', self.visits_df),
+                          ('screenings', self.screening_df), ('lab_results', self.lab_results_df)]:
+            if df is not None:
+                counts, issues = self._validate_table(table, df)
+            elif table in self.streamed_validation:
+                counts, issues = self.streamed_validation[table]
+            else:
+                continue
+            counts_list.append(counts)
+            issue_frames.append(issues)
         
-        # TODO: Check for missing patient IDs
-        # If any patient_id is null, add issue to self.data_quality_issues list
-        missing_patient_ids = self.patients_df['patient_id'].isnull().sum()
-        if missing_patient_ids > 0:
-            self.data_quality_issues.append(f"Missing patient IDs: {missing_patient_ids}")
-        
-        # TODO: Check for invalid ages (negative or > 120)
-        # Count how many patients have invalid ages
-        invalid_ages = len(self.patients_df[(self.patients_df['age'] < 0) | (self.patients_df['age'] > 120)])
-        if invalid_ages > 0:
-            self.data_quality_issues.append(f"Invalid ages (negative or >120): {invalid_ages}")
-        
-        # TODO: Check for invalid gender codes (not M or F)
-        # Count how many patients have invalid gender
-        invalid_gender = len(self.patients_df[~self.patients_df['gender'].isin(['M', 'F'])])
-        if invalid_gender > 0:
-            self.data_quality_issues.append(f"Invalid gender codes: {invalid_gender}")
-        
-        # TODO: Check for missing phone numbers or email addresses
-        missing_phone = self.patients_df['phone'].isnull().sum()
-        missing_email = self.patients_df['email'].isnull().sum()
-        if missing_phone > 0:
-            self.data_quality_issues.append(f"Missing phone numbers: {missing_phone}")
-        if missing_email > 0:
-            self.data_quality_issues.append(f"Missing email addresses: {missing_email}")
+        self._combine_validation(counts_list, issue_frames)
+        self._report_data_quality()
+    
+    def _validate_table(self, table, df):
+        """
+        Evaluate all DATA_QUALITY_RULES for one table in a single vectorized pass.
+        Returns the issue counts and the per-row issue table for failing rows,
+        where bit i of issue_mask is DATA_QUALITY_RULES[table][i].
+        """
+        masks = self._issue_masks(table, df)
+        issue_mask = np.zeros(len(df), dtype=np.uint16)
+        for bit, mask in enumerate(masks):
+            issue_mask |= mask.astype(np.uint16) << bit
+        
+        counts = {_issue_label(table, issue): int(mask.sum())
+                  for issue, mask in zip(DATA_QUALITY_RULES[table], masks)}
+        failing = issue_mask != 0
+        issues = pd.DataFrame({
+            'table': table,
+            'row': df.index[failing],
+            'patient_id': df['patient_id'].to_numpy()[failing].astype(object),
+            'issue_mask': issue_mask[failing],
+        })
+        return counts, issues
+    
+    def _table_validation(self, table):
+        """One table's (counts, issues) from the last validate_data_quality."""
+        labels = [_issue_label(table, issue) for issue in DATA_QUALITY_RULES[table]]
+        counts = {label: count for label, count in self.data_quality_counts.items() if label in labels}
+        if self.validation_issues is None:
+            return counts, pd.DataFrame(columns=['table', 'row', 'patient_id', 'issue_mask'])
+        issues = self.validation_issues[self.validation_issues['table'] == table]
+        return counts, issues.astype({'table': object}).reset_index(drop=True)
+    
+    def _combine_validation(self, counts_list, issue_frames):
+        """
+        Sum issue counts and stack issue tables from tables, chunks or shards.
+        """
+        self.data_quality_counts = {}
+        for table, rules in DATA_QUALITY_RULES.items():
+            for issue in rules:
+                label = _issue_label(table, issue)
+                present = [counts[label] for counts in counts_list if label in counts]
+                if present:
+                    self.data_quality_counts[label] = sum(present)
+        
+        issues = pd.concat(issue_frames, ignore_index=True)
+        issues['table'] = pd.Categorical(issues['table'], categories=list(DATA_QUALITY_RULES))
+        self.validation_issues = issues.sort_values(['table', 'row'], kind='stable', ignore_index=True)
+    
+    def _issue_masks(self, table, df):
+        """
+        Boolean masks for DATA_QUALITY_RULES[table], in rule order.
+        """
+        def mask(series):
+            return series.fillna(False).to_numpy(dtype=bool)
+        
+        missing_id = mask(df['patient_id'].isnull())
+        if table == 'patients':
+            invalid_ages = mask((df['age'] < 0) | (df['age'] > 120))
+            invalid_gender = ~mask(df['gender'].isin(['M', 'F']))
+            missing_phone = mask(df['phone'].isnull())
+            missing_email = mask(df['email'].isnull())
+            phone_digits = _phone_digits(df['phone']).str.len()
+            invalid_phone = ~missing_phone & ~mask(phone_digits.isin([7, 10]))
+            invalid_email = ~missing_email & ~mask(validate_emails(df['email']))
+            return [missing_id, invalid_ages, invalid_gender, missing_phone, missing_email,
+                    invalid_phone, invalid_email]
+        
+        unknown_id = ~missing_id & ~mask(df['patient_id'].isin(self.patients_df['patient_id']))
+        if table == 'visits':
+            visit_date = pd.to_datetime(df['visit_date'], errors='coerce')
+            next_appointment = pd.to_datetime(df['next_appointment'], errors='coerce')
+            return [missing_id, unknown_id, mask(visit_date.isna()), mask(next_appointment < visit_date)]
+        if table == 'screenings':
+            duplicate = ~missing_id & mask(df['patient_id'].duplicated())
+            return [missing_id, unknown_id, duplicate]
+        test_date = pd.to_datetime(df['test_date'], errors='coerce')
+        return [missing_id, unknown_id, mask(test_date.isna()), mask(df['result_value'].isnull())]
+    
+    def quarantine_rows(self, table, issues=None):
+        """
+        Rows of a source table flagged by validate_data_quality, optionally only
+        those with one of the given issues, e.g. ['Invalid ages (negative or >120)'].
+        """
+        rules = DATA_QUALITY_RULES[table]
+        bits = range(len(rules)) if issues is None else [rules.index(issue) for issue in issues]
+        selected = sum(1 << bit for bit in bits)
+        
+        source = getattr(self, TABLE_ATTRIBUTES[table])
+        if source is None:
+            raise ValueError(f"{table} was streamed, not loaded; use validation_issues for its flagged rows")
+        
+        issues_df = self.validation_issues
+        flagged = issues_df[(issues_df['table'] == table) & (issues_df['issue_mask'] & selected != 0)]
+        return source.loc[flagged['row']]
+    
+    def _report_data_quality(self):
+        """
+        Build the issue list from data_quality_counts and print the summary.
+        """
+        self.data_quality_issues = [
+            f"{issue}: {count}" for issue, count in self.data_quality_counts.items() if count > 0
+        ]
         
         # TODO: Print summary of data quality issues found
         if self.data_quality_issues:
             print("⚠️  Data Quality Issues Found:")
             for issue in self.data_quality_issues:
                 print(f"   - {issue}")
+            print(f"   {len(self.validation_issues)} rows flagged (see validation_issues)")
         else:
             print("✓ No data quality issues found!")
     
@@ -200,103 +790,198 @@ class HealthcareDataProcessor:
         # In a real system, you might calculate ages from birth dates
         pass
     
-    def identify_care_gaps(self):
+    def identify_care_gaps(self, as_of=None):
         """
         Identify patients who need preventive care based on screening guidelines.
         
+        Gaps are evaluated as of now, or as of the given date (anything
+        pd.Timestamp accepts) for reproducible runs. With as_of only the visits
+        and lab results dated on or before it count; screening due dates are a
+        current snapshot and are compared against as_of as they are.
+        
         Screening Rules:
         - Mammograms: Women 40+ years old
         - Colonoscopies: Everyone 50+ years old  
         - Annual visits: Everyone (within last 12 months)
         - Flu shots: Everyone (annually by October 1st)
+        - Blood pressure checks: Adults 18+
+        - Cholesterol checks: Adults 40+
+        - Diabetic eye exams: Patients with diabetes
+        
+        Lab Rules (patients with diabetes, latest result per test):
+        - HbA1c test: at least every 6 months
+        - HbA1c / glucose control: latest result flagged High, or above target
         """
         print("\n" + "="*50)
         print("IDENTIFYING CARE GAPS")
         print("="*50)
         
-        today = datetime.now()
-        self.care_gaps = []
+        today = datetime.now() if as_of is None else _as_of_datetime(as_of)
+        visit_index, lab_index = self._indexes_as_of(as_of)
         
-        # Merge patients with screening data for easier processing
-        merged_data = self.patients_df.merge(self.screening_df, on='patient_id', how='left')
+        # Merge patients with screening data for easier processing; _row keeps
+        # each merged row's patients_df label for the result store
+        patients = self.patients_df.assign(_row=self.patients_df.index)
+        merged_data = patients.merge(self.screening_df, on='patient_id', how='left')
         
-        # TODO: Loop through each patient and check for care gaps
-        for index, patient in merged_data.iterrows():
-            patient_gaps = []
-            
-            # TODO: Check if patient needs mammogram
-            # Rule: Women (gender == 'F') aged 40 or older
-            # Check if mammogram_due date has passed or is missing
-            if patient['gender'] == 'F' and patient['age'] >= 40:
-                mammogram_due = patient.get('mammogram_due')
-                if pd.isna(mammogram_due) or mammogram_due < today:
-                    patient_gaps.append('Mammogram overdue')
-            
-            # TODO: Check if patient needs colonoscopy
-            # Rule: Everyone aged 50 or older
-            # Check if colonoscopy_due date has passed or is missing
-            if patient['age'] >= 50:
-                colonoscopy_due = patient.get('colonoscopy_due')
-                if pd.isna(colonoscopy_due) or colonoscopy_due < today:
-                    patient_gaps.append('Colonoscopy overdue')
-            
-            # TODO: Check if patient needs annual visit
-            # Rule: Everyone should have visited within last 12 months
-            # Compare last visit date with current date
-            patient_visits = self.visits_df[self.visits_df['patient_id'] == patient['patient_id']]
-            if len(patient_visits) > 0:
-                last_visit = patient_visits['visit_date'].max()
-                if pd.isna(last_visit) or (today - last_visit).days > 365:
-                    patient_gaps.append('Annual visit overdue')
-            else:
-                patient_gaps.append('Annual visit overdue')
-            
-            # TODO: Check if patient needs flu shot
-            # Rule: Everyone should get flu shot by October 1st each year
-            # Check if flu_shot_due date has passed
-            flu_shot_due = patient.get('flu_shot_due')
-            if pd.isna(flu_shot_due) or flu_shot_due < today:
-                patient_gaps.append('Flu shot needed')
-            
-            # If any gaps found, add patient to care_gaps list
-            if patient_gaps:
-                self.care_gaps.append({
-                    'patient_id': patient['patient_id'],
-                    'name': f"{patient['first_name']} {patient['last_name']}",
-                    'age': patient['age'],
-                    'gender': patient['gender'],
-                    'phone': patient['phone'],
-                    'email': patient['email'],
-                    'gaps': patient_gaps,
-                    'priority': self._calculate_priority(patient_gaps, patient)
-                })
+        # Evaluate every rule over the whole merged frame at once
+        self.gap_matrix = self._evaluate_gap_rules(merged_data, today, visit_index, lab_index)
+        priorities = self._calculate_priorities(self.gap_matrix, merged_data['age'])
+        
+        flagged = self.gap_matrix.any(axis=1).to_numpy()
+        self.care_gaps = CareGapStore(merged_data['_row'].to_numpy()[flagged],
+                                      _gap_masks(self.gap_matrix)[flagged], priorities[flagged],
+                                      self.gap_rules.gap_types)
+        self.gap_aggregates = None
+        self.gaps_evaluated_at = today
         
         print(f"✓ Identified {len(self.care_gaps)} patients with care gaps")
     
-    def _calculate_priority(self, gaps, patient):
+    def backtest_care_gaps(self, as_of_dates):
         """
-        Calculate priority level based on gap types and patient factors.
-        This is a helper function for the care gap identification.
+        Evaluate care gaps as of every date in as_of_dates in one vectorized pass.
+        
+        Returns a CareGapCube (patients x dates) matching identify_care_gaps(as_of)
+        for each date. Due dates are compared against all dates at once. For
+        the visit, HbA1c recency and lab control rules, every visit or result
+        covers a range of dates (from its own date until it ages out of the
+        window or the patient's next result replaces it); the ranges are
+        summed over the patients x dates grid instead of rebuilding the indexes
+        per date. Needs the in-memory visits and lab results (not a streamed run).
         """
-        today = datetime.now()
-        priority_score = 0
+        if self.visits_df is None or self.lab_results_df is None:
+            raise ValueError("backtest_care_gaps needs visits_df and lab_results_df; "
+                             "streamed runs do not keep them")
+        if self.lab_timeline is None:
+            self.build_lab_index()
+        
+        dates = pd.DatetimeIndex([_as_of_datetime(as_of) for as_of in as_of_dates])
+        order = np.argsort(dates.to_numpy(), kind='stable')
+        grid = dates.to_numpy(dtype='datetime64[ns]')[order]
+        
+        patients = self.patients_df.assign(_row=self.patients_df.index)
+        merged_data = patients.merge(self.screening_df, on='patient_id', how='left')
+        plan = self.gap_rules
+        eligible = plan.eligible(merged_data)
+        
+        # History conditions are covered per patient_id, then looked up for each merged row
+        patient_keys = pd.Index(merged_data['patient_id'].dropna().unique())
+        row_keys = patient_keys.get_indexer(merged_data['patient_id'])
+        visits = self.visits_df.dropna(subset=['patient_id', 'visit_date'])
+        labs = self.lab_timeline
+        
+        # Every distinct gap condition against every as-of date
+        conditions = []
+        for kind, *args in plan.conditions:
+            if kind == 'due':
+                due = merged_data[args[0]].to_numpy(dtype='datetime64[ns]')
+                conditions.append(np.isnat(due)[:, None] | (due[:, None] < grid[None, :]))
+            elif kind == 'no_visit_within':
+                # A visit keeps the rule covered for `days` days after the visit date
+                visit_dates = visits['visit_date'].to_numpy(dtype='datetime64[ns]')
+                covered = _date_coverage(patient_keys.get_indexer(visits['patient_id'].astype(str)), visit_dates,
+                                         visit_dates + np.timedelta64(args[0] + 1, 'D'), grid, len(patient_keys))
+                conditions.append(~covered[row_keys])
+            else:
+                # Lab conditions: each result is the latest until the patient's next result of that
+                # test, and an undated result until the patient's first dated one
+                results = labs[labs['test_type'].astype(str) == args[0]]
+                if kind == 'no_lab_within':
+                    results = results.dropna(subset=['test_date'])
+                    test_dates = results['test_date'].to_numpy(dtype='datetime64[ns]')
+                    tested_until = test_dates + np.timedelta64(args[1] + 1, 'D')
+                    covered = _date_coverage(patient_keys.get_indexer(results['patient_id']), test_dates,
+                                             tested_until, grid, len(patient_keys))
+                    conditions.append(~covered[row_keys])
+                    continue
+                
+                results = results.assign(test_date=results['test_date'].fillna(pd.Timestamp.min))
+                results = results.sort_values(['patient_id', 'test_date'], kind='stable')
+                keys = patient_keys.get_indexer(results['patient_id'])
+                test_dates = results['test_date'].to_numpy(dtype='datetime64[ns]')
+                result_ids = results['patient_id'].to_numpy()
+                replaced = np.full(len(results), pd.Timestamp.max.to_datetime64())
+                same_patient = result_ids[1:] == result_ids[:-1]
+                replaced[:-1][same_patient] = test_dates[1:][same_patient]
+                latest = pd.DataFrame({
+                    f'{args[0]}_value': pd.to_numeric(results['result_value'], errors='coerce').to_numpy(),
+                    f'{args[0]}_status': results['status'].astype(object).to_numpy(),
+                })
+                off = _out_of_target(latest, *args).to_numpy(dtype=bool)
+                latest_off = _date_coverage(keys[off], test_dates[off], replaced[off], grid, len(patient_keys))
+                conditions.append(latest_off[row_keys])
+        
+        shape = (len(merged_data), len(grid))
+        gap_mask = np.zeros(shape, dtype=np.uint32)
+        priority_score = np.zeros(shape, dtype=np.int64)
+        gap_count = np.zeros(shape, dtype=np.int64)
+        for i, (code, condition) in enumerate(zip(plan.codes, plan.rule_conditions)):
+            gaps = eligible[:, i, None] & conditions[condition]
+            gap_mask |= gaps.astype(np.uint32) << i
+            priority_score += gaps * plan.weights[code]
+            gap_count += gaps
+        senior = (merged_data['age'] >= plan.senior_age).fillna(False).to_numpy(dtype=bool)[:, None]
+        priority = _priority_levels(priority_score + gap_count * senior)
+        
+        # Back to the order the dates were given in
+        restore = np.argsort(order, kind='stable')
+        return CareGapCube(merged_data['_row'].to_numpy(), merged_data['patient_id'].to_numpy(), dates,
+                           gap_mask[:, restore], priority[:, restore], plan.gap_types)
+    
+    def _indexes_as_of(self, as_of):
+        """
+        Visit and lab indexes built from the records dated on or before as_of,
+        or (None, None) to use the regular indexes: when as_of is None, or for
+        streamed runs and loaded gap states, which only keep the latest visit
+        and lab aggregates. Those cannot be rolled back, so ValueError is
+        raised when they hold records dated after as_of.
+        Undated lab results are kept, as in the regular index: one is a
+        patient's latest result of its test only while there is no dated one.
+        """
+        if as_of is None:
+            return None, None
+        as_of = _as_of_datetime(as_of)
+        if self.visits_df is None or self.lab_results_df is None:
+            _check_aggregates_as_of(as_of, self.visit_index, self.lab_index)
+            return None, None
+        if self.lab_timeline is None:
+            self.build_lab_index()
+        
+        visit_index = _aggregate_visits(self.visits_df[self.visits_df['visit_date'] <= as_of])
+        test_dates = self.lab_timeline['test_date']
+        timeline = self.lab_timeline[(test_dates <= as_of) | test_dates.isna()]
+        return visit_index, _wide_lab_index(_latest_lab_results(timeline))
+    
+    def _evaluate_gap_rules(self, merged_data, today, visit_index=None, lab_index=None):
+        """
+        Evaluate the screening rules (self.gap_rules) as boolean masks over the merged frame.
+        Returns the gap matrix: one row per merged row, one column per rule code.
+        visit_index and lab_index default to the processor's own indexes.
+        """
+        if visit_index is None and self.gap_rules.uses_visits:
+            if self.visit_index is None:
+                self.build_visit_index()
+            visit_index = self.visit_index
+        if lab_index is None and self.gap_rules.uses_labs:
+            if self.lab_index is None:
+                self.build_lab_index()
+            lab_index = self.lab_index
+        
+        gaps = self.gap_rules.evaluate(merged_data, today, visit_index, lab_index)
+        return pd.DataFrame(gaps, index=merged_data.index, columns=self.gap_rules.codes)
+    
+    def _calculate_priorities(self, gap_matrix, ages):
+        """
+        Calculate priority levels for every row of the gap matrix, as indexes
+        into PRIORITY_LEVELS. Each gap adds its rule's weight, plus one point
+        per gap for patients aged the rules' senior_age or older.
+        """
+        weights = np.array([self.gap_rules.weights[code] for code in gap_matrix.columns])
+        gaps = gap_matrix.to_numpy()
+        senior = (ages >= self.gap_rules.senior_age).fillna(False).to_numpy(dtype=bool)
+        priority_score = gaps @ weights + gaps.sum(axis=1) * senior
         
-        for gap in gaps:
-            if 'overdue' in gap.lower():
-                priority_score += 2
-            elif 'needed' in gap.lower():
-                priority_score += 1
-            
-            # Higher priority for older patients
-            if patient['age'] >= 65:
-                priority_score += 1
-        
-        if priority_score >= 3:
-            return 'High'
-        elif priority_score >= 2:
-            return 'Medium'
-        else:
-            return 'Low'
+        return _priority_levels(priority_score)
     
     def categorize_gaps_by_priority(self):
         """
@@ -306,18 +991,9 @@ class HealthcareDataProcessor:
         print("CATEGORIZING CARE GAPS")
         print("="*50)
         
-        gap_types = {}
-        priority_counts = {'High': 0, 'Medium': 0, 'Low': 0}
-        
-        for patient in self.care_gaps:
-            # Count by priority
-            priority_counts[patient['priority']] += 1
-            
-            # Count by gap type
-            for gap in patient['gaps']:
-                if gap not in gap_types:
-                    gap_types[gap] = 0
-                gap_types[gap] += 1
+        aggregates = self.summary_aggregates()
+        gap_types = dict(aggregates.gap_types)
+        priority_counts = dict(aggregates.priority_counts)
         
         print("Gap Types:")
         for gap_type, count in gap_types.items():
@@ -329,6 +1005,16 @@ class HealthcareDataProcessor:
         
         return gap_types, priority_counts
     
+    def summary_aggregates(self):
+        """
+        The GapAggregates of the current care gaps, built on first use and
+        shared by the report, the charts and the exports until care gaps
+        are identified or updated again.
+        """
+        if self.gap_aggregates is None:
+            self.gap_aggregates = GapAggregates.build(self.care_gaps, self.patients_df)
+        return self.gap_aggregates
+    
     def generate_summary_report(self):
         """
         Generate a comprehensive summary report.
@@ -337,8 +1023,9 @@ class HealthcareDataProcessor:
         print("GENERATING SUMMARY REPORT")
         print("="*50)
         
+        aggregates = self.summary_aggregates()
         total_patients = len(self.patients_df)
-        patients_with_gaps = len(self.care_gaps)
+        patients_with_gaps = aggregates.patients_with_gaps
         gap_percentage = (patients_with_gaps / total_patients) * 100 if total_patients > 0 else 0
         
         gap_types, priority_counts = self.categorize_gaps_by_priority()
@@ -361,7 +1048,16 @@ Priority Levels:
 - High Priority: {priority_counts['High']} patients
 - Medium Priority: {priority_counts['Medium']} patients  
 - Low Priority: {priority_counts['Low']} patients
-
+"""
+        
+        for title, counts in [('Age Groups', aggregates.age_groups), ('Gender', aggregates.gender_counts),
+                              ('Primary Diagnoses', aggregates.diagnosis_counts)]:
+            report += f"\n{title}:"
+            for value, count in counts.items():
+                report += f"\n- {value}: {count} patients"
+            report += "\n"
+        
+        report += f"""
 Data Quality Issues: {len(self.data_quality_issues)} found
 """
         
@@ -375,9 +1071,13 @@ Data Quality Issues: {len(self.data_quality_issues)} found
         
         return report
     
-    def create_visualizations(self):
+    def create_visualizations(self, headless=False, background=False):
         """
         Create charts and graphs to visualize the care gap data.
+        
+        matplotlib is only imported here. headless=True renders with the
+        non-interactive Agg backend and never opens a window; background=True
+        hands rendering to a worker process (see wait_for_visualizations).
         """
         print("\n" + "="*50)
         print("CREATING VISUALIZATIONS")
@@ -387,50 +1087,40 @@ Data Quality Issues: {len(self.data_quality_issues)} found
             print("No care gaps to visualize!")
             return
         
-        # Create figure with subplots for multiple charts
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 10))
-        fig.suptitle('Healthcare Care Gap Analysis', fontsize=16)
-        
-        # 1. Gap types bar chart
-        gap_types, _ = self.categorize_gaps_by_priority()
-        ax1.bar(gap_types.keys(), gap_types.values(), color='skyblue')
-        ax1.set_title('Care Gaps by Type')
-        ax1.set_ylabel('Number of Patients')
-        ax1.tick_params(axis='x', rotation=45)
-        
-        # 2. Priority levels pie chart
-        _, priority_counts = self.categorize_gaps_by_priority()
-        if sum(priority_counts.values()) > 0:
-            ax2.pie(priority_counts.values(), labels=priority_counts.keys(), autopct='%1.1f%%')
-            ax2.set_title('Care Gaps by Priority Level')
-        
-        # 3. Age distribution of patients with gaps
-        ages = [patient['age'] for patient in self.care_gaps]
-        ax3.hist(ages, bins=10, color='lightgreen', alpha=0.7)
-        ax3.set_title('Age Distribution of Patients with Care Gaps')
-        ax3.set_xlabel('Age')
-        ax3.set_ylabel('Number of Patients')
-        
-        # 4. Gender breakdown of patients with gaps
-        gender_counts = {}
-        for patient in self.care_gaps:
-            gender = patient['gender']
-            gender_counts[gender] = gender_counts.get(gender, 0) + 1
-        
-        if gender_counts:
-            ax4.bar(gender_counts.keys(), gender_counts.values(), color='orange')
-            ax4.set_title('Care Gaps by Gender')
-            ax4.set_ylabel('Number of Patients')
-        
-        plt.tight_layout()
-        plt.savefig('care_gaps_chart.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        aggregates = self.summary_aggregates()
+        if background:
+            # Drop the previous chart so a failed render cannot leave it looking current
+            if os.path.exists(CHART_PATH):
+                os.remove(CHART_PATH)
+            self._chart_pool = ProcessPoolExecutor(max_workers=1)
+            self.chart_future = self._chart_pool.submit(render_care_gap_chart, aggregates, CHART_PATH)
+            print(f"✓ Rendering '{CHART_PATH}' in the background")
+            return
         
-        print("✓ Visualization saved as 'care_gaps_chart.png'")
+        render_care_gap_chart(aggregates, CHART_PATH, show=not headless)
+        print(f"✓ Visualization saved as '{CHART_PATH}'")
+    
+    def wait_for_visualizations(self):
+        """
+        Wait for a chart started with create_visualizations(background=True).
+        """
+        if self.chart_future is None:
+            return
+        self.chart_future.result()
+        self._chart_pool.shutdown()
+        self.chart_future = self._chart_pool = None
+        print(f"✓ Visualization saved as '{CHART_PATH}'")
     
-    def export_results(self):
+    def export_results(self, fmt='csv', partition_by=None, path=None,
+                       chunk_rows=DEFAULT_EXPORT_CHUNK_ROWS):
         """
         Export detailed results to CSV files.
+        
+        The care gaps report is written straight from the care gap store in chunks
+        of chunk_rows, as fmt 'csv', 'csv.gz', 'parquet' or 'ndjson'. With
+        partition_by='priority' or 'gap_type' it becomes a directory with one
+        file per priority or gap type (see export_care_gaps). The summary
+        aggregates are saved next to it as SUMMARY_EXPORT_PATH.
         """
         print("\n" + "="*50)
         print("EXPORTING RESULTS")
@@ -438,22 +1128,16 @@ Data Quality Issues: {len(self.data_quality_issues)} found
         
         if self.care_gaps:
             # Create detailed care gaps report
-            gaps_data = []
-            for patient in self.care_gaps:
-                gaps_data.append({
-                    'patient_id': patient['patient_id'],
-                    'name': patient['name'],
-                    'age': patient['age'],
-                    'gender': patient['gender'],
-                    'phone': patient['phone'],
-                    'email': patient['email'],
-                    'care_gaps': ', '.join(patient['gaps']),
-                    'priority': patient['priority']
-                })
+            path = path or 'care_gaps_report' + ('' if partition_by else EXPORT_FORMATS[fmt])
+            written = export_care_gaps(self.care_gaps, self.patients_df, path, fmt=fmt,
+                                       partition_by=partition_by, chunk_rows=chunk_rows)
+            if partition_by:
+                print(f"✓ Care gaps report saved to '{path}' ({len(written)} {partition_by} files)")
+            else:
+                print(f"✓ Care gaps report saved to '{path}'")
             
-            gaps_df = pd.DataFrame(gaps_data)
-            gaps_df.to_csv('care_gaps_report.csv', index=False)
-            print("✓ Care gaps report saved to 'care_gaps_report.csv'")
+            self.summary_aggregates().to_frame().to_csv(SUMMARY_EXPORT_PATH, index=False)
+            print(f"✓ Care gap summary saved to '{SUMMARY_EXPORT_PATH}'")
         
         # Create data quality report
         if self.data_quality_issues:
@@ -465,37 +1149,334 @@ Data Quality Issues: {len(self.data_quality_issues)} found
                     f.write(f"- {issue}\n")
             print("✓ Data quality report saved to 'data_quality_report.txt'")
     
-    def run_full_analysis(self):
+    def save_gap_state(self, path=DEFAULT_STATE_PATH):
         """
-        Run the complete healthcare data analysis pipeline.
-        This is the main function that calls all other methods in order.
+        Save the per-patient state needed to update care gaps incrementally.
         """
-        print("🏥 Healthcare Data Pipeline Starting...")
+        state = {
+            'patients_df': self.patients_df,
+            'screening_df': self.screening_df,
+            'visit_index': self.visit_index,
+            'lab_index': self.lab_index,
+            'care_gaps': self.care_gaps,
+            'gap_aggregates': self.gap_aggregates,
+            'patient_id_map': self.patient_id_map,
+            'data_quality_counts': self.data_quality_counts,
+            # Visits and lab results are not kept, so the next run_incremental
+            # validates them from their last results, as a streamed run does
+            'streamed_validation': {table: self._table_validation(table) for table in ['visits', 'lab_results']},
+            'gaps_evaluated_at': self.gaps_evaluated_at,
+        }
+        pd.to_pickle(state, path)
+        print(f"✓ Care gap state saved to '{path}'")
+    
+    def load_gap_state(self, path=DEFAULT_STATE_PATH):
+        """
+        Load state written by save_gap_state.
+        """
+        for name, value in pd.read_pickle(path).items():
+            setattr(self, name, value)
+        self.gap_matrix = None
+        print(f"✓ Care gap state loaded from '{path}' (evaluated {self.gaps_evaluated_at:%Y-%m-%d %H:%M:%S})")
+    
+    def apply_deltas(self, patients_path=None, visits_path=None, screenings_path=None,
+                     lab_results_path=None, as_of=None):
+        """
+        Fold delta files into the loaded gap state and re-evaluate care gaps
+        only for the affected patients.
+        
+        Delta files are read with the schema of their source CSV (CSV_SCHEMAS).
+        Patient and screening rows replace the stored rows for their patient_id.
+        Visit and lab result rows are treated as new records and folded into the
+        visit and lab indexes (a lab result replaces the stored one of its test
+        unless it is older); their data quality issues are added to the stored
+        validation of their table.
+        Patients whose due dates or annual-visit window lapsed since the last
+        evaluation are re-evaluated too, since time alone can open a gap. Rows
+        for a patient_id that was linked to another patient are applied to the
+        canonical patient; deltas are not linked against each other.
+        as_of sets the evaluation date (default now). The saved state only has
+        the latest visits and results, so ValueError is raised, before anything
+        is applied, when they or the delta visits and results are dated after as_of.
+        """
+        print("\n" + "="*50)
+        print("APPLYING INCREMENTAL UPDATES")
+        print("="*50)
+        
+        today = datetime.now() if as_of is None else _as_of_datetime(as_of)
+        if visits_path:
+            visits = _remap_patient_ids(read_csv_with_schema(visits_path, table='visits.csv'), self.patient_id_map)
+            visits['visit_date'] = pd.to_datetime(visits['visit_date'], errors='coerce')
+            visits['next_appointment'] = pd.to_datetime(visits['next_appointment'], errors='coerce')
+        if lab_results_path:
+            labs = _remap_patient_ids(read_csv_with_schema(lab_results_path, table='lab_results.csv'),
+                                      self.patient_id_map)
+            labs['test_date'] = pd.to_datetime(labs['test_date'], errors='coerce')
+        if as_of is not None:
+            _check_aggregates_as_of(today, self.visit_index, self.lab_index,
+                                    _aggregate_visits(visits) if visits_path else None,
+                                    _wide_lab_index(_latest_lab_results(labs)) if lab_results_path else None)
+        affected = set()
+        gap_patient_ids = self.care_gaps.patient_ids(self.patients_df)
+        
+        if patients_path:
+            delta = _remap_patient_ids(read_csv_with_schema(patients_path, table='patients.csv'), self.patient_id_map)
+            delta = delta.drop_duplicates(subset=['patient_id'])
+            delta['gender'] = delta['gender'].str.upper()
+            delta['phone'] = normalize_phone_numbers(delta['phone'])
+            # New rows get fresh labels so stored care gaps keep pointing at their rows
+            next_label = self.patients_df.index.max() + 1 if len(self.patients_df) else 0
+            delta.index = pd.RangeIndex(next_label, next_label + len(delta))
+            unchanged = ~self.patients_df['patient_id'].isin(delta['patient_id'])
+            self.patients_df = pd.concat([self.patients_df[unchanged], delta])
+            affected.update(delta['patient_id'].dropna())
+            print(f"Patients updated: {len(delta)}")
+        
+        if screenings_path:
+            delta = _remap_patient_ids(read_csv_with_schema(screenings_path, table='screenings.csv'),
+                                       self.patient_id_map)
+            for col in [col for col in delta.columns if col.endswith('_due')]:
+                delta[col] = pd.to_datetime(delta[col], errors='coerce')
+            unchanged = ~self.screening_df['patient_id'].isin(delta['patient_id'])
+            self.screening_df = pd.concat([self.screening_df[unchanged], delta], ignore_index=True)
+            affected.update(delta['patient_id'].dropna())
+            print(f"Screening records updated: {len(delta)}")
+        
+        if visits_path:
+            self.visit_index = _combine_visit_aggregates(self.visit_index, _aggregate_visits(visits))
+            validation = [self.streamed_validation['visits']] if 'visits' in self.streamed_validation else []
+            self.streamed_validation['visits'] = _sum_validation(validation + [self._validate_table('visits', visits)])
+            affected.update(visits['patient_id'].dropna().astype(str))
+            print(f"New visits: {len(visits)}")
+        
+        if lab_results_path:
+            # Stored results come first, so a delta result wins a tie as a later row would
+            latest = pd.concat([_lab_index_results(self.lab_index), labs], ignore_index=True)
+            self.lab_index = _wide_lab_index(_latest_lab_results(latest))
+            validation = [self.streamed_validation['lab_results']] if 'lab_results' in self.streamed_validation else []
+            self.streamed_validation['lab_results'] = _sum_validation(
+                validation + [self._validate_table('lab_results', labs)])
+            affected.update(labs['patient_id'].dropna().astype(str))
+            print(f"New lab results: {len(labs)}")
+        
+        lapsed = self._lapsed_patients(self.gaps_evaluated_at, today)
+        print(f"Patients with lapsed due dates: {len(lapsed)}")
+        affected |= lapsed
+        
+        # Re-evaluate the affected patients only
+        patients = self.patients_df[self.patients_df['patient_id'].isin(affected)]
+        patients = patients.assign(_row=patients.index)
+        screenings = self.screening_df[self.screening_df['patient_id'].isin(affected)]
+        merged_data = patients.merge(screenings, on='patient_id', how='left')
+        gap_matrix = self._evaluate_gap_rules(merged_data, today)
+        priorities = self._calculate_priorities(gap_matrix, merged_data['age'])
+        flagged = gap_matrix.any(axis=1).to_numpy()
+        new_gaps = CareGapStore(merged_data['_row'].to_numpy()[flagged],
+                                _gap_masks(gap_matrix)[flagged], priorities[flagged], self.gap_rules.gap_types)
+        
+        # Swap the affected patients' results and recount
+        kept = ~gap_patient_ids.isin(affected).to_numpy()
+        self.care_gaps = CareGapStore.concat([self.care_gaps.take(kept), new_gaps])
+        self.gap_aggregates = None
+        self.gap_matrix = None
+        self.gaps_evaluated_at = today
+        
+        print(f"✓ Re-evaluated {len(affected)} patients; "
+              f"{len(self.care_gaps)} patients with care gaps")
+    
+    def _lapsed_patients(self, since, today):
+        """
+        Patients whose care gaps can change between `since` and `today` without
+        any new records: a due date fell in between, or the last visit or last
+        lab result aged past its rule's window.
+        """
+        lapsed = pd.Series(False, index=self.screening_df.index)
+        for col in [col for col in self.screening_df.columns if col.endswith('_due')]:
+            due = self.screening_df[col]
+            lapsed |= ((due >= since) & (due < today)).fillna(False)
+        patient_ids = set(self.screening_df.loc[lapsed, 'patient_id'].dropna())
+        
+        for kind, *args in self.gap_rules.conditions:
+            if kind == 'no_visit_within':
+                index, last, days = self.visit_index, self.visit_index['last_visit_date'], args[0]
+            elif kind == 'no_lab_within':
+                index, last, days = self.lab_index, self.lab_index[f'{args[0]}_date'], args[1]
+            else:
+                continue
+            crossed = ((since - last).dt.days <= days) & ((today - last).dt.days > days)
+            patient_ids.update(index.index[crossed.fillna(False).to_numpy()])
+        return patient_ids
+    
+    def run_incremental(self, state_path=DEFAULT_STATE_PATH, patients_path=None,
+                        visits_path=None, screenings_path=None, lab_results_path=None, as_of=None):
+        """
+        Nightly entry point: update the previous run's care gaps from delta
+        files, then regenerate the report and exports and save the new state.
+        """
+        print("🏥 Healthcare Data Pipeline (incremental) Starting...")
         print("=" * 60)
         
-        # Step 1: Load data
-        self.load_data()
+        self.load_gap_state(state_path)
+        self.apply_deltas(patients_path, visits_path, screenings_path, lab_results_path, as_of=as_of)
+        self.validate_data_quality()
+        self.generate_summary_report()
+        self.export_results()
+        self.save_gap_state(state_path)
         
-        # Step 2: Explore data
-        self.explore_data()
+        print("\n" + "="*60)
+        print("🎉 Incremental update completed successfully!")
+        print("="*60)
+    
+    def run_sharded(self, workers, as_of=None):
+        """
+        Run clean -> validate -> identify care gaps on a process pool.
         
-        # Step 3: Clean data
-        self.clean_data()
+        Patients, screenings, visits and lab results are hash-partitioned by
+        patient_id after record linkage, so every record of a patient lands in
+        the same shard and each shard can be processed on its own. Shard results are merged back
+        in the serial patient order, so the report matches a serial run. The
+        cleaned tables and indexes replace the raw ones, as after clean_data.
+        """
+        print("\n" + "="*50)
+        print(f"RUNNING SHARDED PIPELINE ({workers} workers)")
+        print("="*50)
         
-        # Step 4: Validate data quality
-        self.validate_data_quality()
+        # Duplicates of one person can hash to different shards, so link them first
+        self.link_patient_records()
+        
+        tables = {
+            'patients_df': self.patients_df,
+            'screening_df': self.screening_df,
+            'visits_df': self.visits_df,
+            'lab_results_df': self.lab_results_df,
+            'visit_index': self.visit_index if self.visits_df is None else None,
+            'latest_lab_results': self.latest_lab_results,
+        }
+        partitions = {name: _partition_by_patient(df, workers) for name, df in tables.items()}
+        shards = [{name: parts[i] for name, parts in partitions.items()} for i in range(workers)]
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(functools.partial(_run_shard, as_of=as_of, gap_rules=self.gap_rules), shards))
+        
+        # Shards keep the original patients_df labels, so sorting by label restores the serial order
+        care_gaps = CareGapStore.concat([result['care_gaps'] for result in results])
+        care_gaps = care_gaps.take(np.argsort(care_gaps.rows, kind='stable'))
+        
+        duplicates_removed = sum(result['duplicates_removed'] for result in results)
+        self.patients_df = pd.concat([result['patients_df'] for result in results]).sort_index()
+        self.screening_df = pd.concat([result['screening_df'] for result in results]).sort_index()
+        # Cleaned visits and lab results, so later as-of evaluations and backtests see parsed dates
+        if self.visits_df is not None:
+            self.visits_df = pd.concat([result['visits_df'] for result in results]).sort_index()
+        if self.lab_results_df is not None:
+            self.lab_results_df = pd.concat([result['lab_results_df'] for result in results]).sort_index()
+            self.lab_timeline = pd.concat([result['lab_timeline'] for result in results]).sort_values(
+                ['patient_id', 'test_date'], kind='stable', ignore_index=True)
+        self.visit_index = pd.concat([result['visit_index'] for result in results])
+        self.lab_index = pd.concat([result['lab_index'] for result in results])
+        validation = [(result['data_quality_counts'], result['validation_issues']) for result in results]
+        validation += list(self.streamed_validation.values())
+        self._combine_validation([counts for counts, _ in validation], [issues for _, issues in validation])
+        self.care_gaps = care_gaps
+        self.gap_matrix = None
+        self.gap_aggregates = None
+        self.gaps_evaluated_at = results[0]['gaps_evaluated_at']
         
-        # Step 5: Identify care gaps
-        self.identify_care_gaps()
+        print(f"Removed {duplicates_removed} duplicate patient records")
+        self._report_data_quality()
+        print(f"✓ Identified {len(self.care_gaps)} patients with care gaps")
+    
+    def run_full_analysis(self, streaming=False, memory_limit_mb=DEFAULT_STREAM_MEMORY_MB,
+                          use_cache=False, cache_dir=DEFAULT_CACHE_DIR, workers=1, state_path=None,
+                          profile_path=None, profile_stage=None, charts='inline',
+                          export_format='csv', export_partition=None, patient_store_dir=None, as_of=None,
+                          checkpoint_dir=None, stages=None):
+        """
+        Run the complete healthcare data analysis pipeline.
+        This is the main function that calls all other methods in order.
+        Pass streaming=True to ingest visits and lab results in bounded memory,
+        or use_cache=True to reuse cleaned data from a previous run when the
+        source files have not changed (in-memory path only). With workers > 1,
+        steps 3-5 run sharded by patient_id on a process pool. Pass state_path
+        to save the care gap state for later run_incremental updates.
+        
+        Every stage is timed into self.run_profile; profile_path writes it as
+        JSON and profile_stage (e.g. 'identify_care_gaps') captures cProfile
+        stats for that one stage.
+        
+        charts controls step 7: 'inline' renders and shows the chart, 'headless'
+        only saves it, 'background' renders it in a worker process while the
+        export runs, and 'skip' never imports matplotlib at all.
+        export_format and export_partition are passed to export_results.
+        patient_store_dir saves the cleaned tables for evaluate_patients.
+        as_of evaluates care gaps as of that date instead of now.
+        
+        checkpoint_dir makes the run resumable: every stage of PIPELINE_STAGES
+        records its inputs there on success (clean_data, validate_data_quality and
+        identify_care_gaps also their outputs), and stages whose inputs have not
+        changed since are skipped, so a run that failed late restarts where it
+        stopped. stages runs only the named stages, e.g. ['export_results'],
+        against the checkpointed upstream outputs (see StageCheckpoints).
+        """
+        print("🏥 Healthcare Data Pipeline Starting...")
+        print("=" * 60)
         
+        if stages and not checkpoint_dir:
+            raise ValueError("Running selected stages needs a checkpoint_dir with their upstream outputs")
+        
+        profiler = self.run_profile = StageProfiler(self, profile_stage=profile_stage)
+        cache = CleanedDataCache(cache_dir) if use_cache and not streaming else None
+        export_path = 'care_gaps_report' + ('' if export_partition else EXPORT_FORMATS[export_format])
+        checkpoints = StageCheckpoints(checkpoint_dir, params={
+            'clean_data': {'streaming': streaming, 'memory_limit_mb': memory_limit_mb if streaming else None},
+            'identify_care_gaps': {'as_of': str(as_of or datetime.now().date()),
+                                   'rules': self.gap_rules.definition},
+            'save_gap_state': {'path': state_path},
+            'save_patient_store': {'path': patient_store_dir},
+            'export_results': {'format': export_format, 'partition': export_partition},
+        }, outputs={
+            'save_gap_state': [state_path],
+            'save_patient_store': [patient_store_dir],
+            'generate_summary_report': ['summary_statistics.txt'],
+            'create_visualizations': [CHART_PATH],
+            'export_results': [export_path, SUMMARY_EXPORT_PATH],
+        })
+        
+        # Steps 1-3: Load, explore and clean the data (with workers > 1, steps 3-5 run per shard)
+        runners = {
+            'clean_data': lambda: self._load_and_clean(profiler, cache, streaming, memory_limit_mb, workers, as_of),
+            # Step 4: Validate data quality
+            'validate_data_quality': lambda: profiler.run('validate_data_quality', self.validate_data_quality),
+            # Step 5: Identify care gaps
+            'identify_care_gaps': lambda: profiler.run('identify_care_gaps', self.identify_care_gaps, as_of),
+        }
+        if state_path:
+            runners['save_gap_state'] = lambda: profiler.run('save_gap_state', self.save_gap_state, state_path)
+        if patient_store_dir:
+            runners['save_patient_store'] = lambda: profiler.run('save_patient_store', self.save_patient_store,
+                                                                 patient_store_dir)
         # Step 6: Generate reports
-        self.generate_summary_report()
-        
+        runners['generate_summary_report'] = lambda: profiler.run('generate_summary_report',
+                                                                  self.generate_summary_report)
         # Step 7: Create visualizations
-        self.create_visualizations()
-        
+        if charts != 'skip':
+            runners['create_visualizations'] = lambda: profiler.run(
+                'create_visualizations', self.create_visualizations,
+                headless=charts != 'inline', background=charts == 'background')
         # Step 8: Export results
-        self.export_results()
+        runners['export_results'] = lambda: profiler.run('export_results', self.export_results,
+                                                         fmt=export_format, partition_by=export_partition)
+        
+        bundled = {'clean_data': ['validate_data_quality', 'identify_care_gaps']} if workers > 1 else {}
+        checkpoints.run(self, runners, stages=stages, bundled=bundled)
+        
+        if self.chart_future is not None:
+            with profiler.stage('wait_for_visualizations'):
+                self.wait_for_visualizations()
+        
+        profiler.print_summary()
+        if profile_path:
+            profiler.save_json(profile_path)
         
         print("\n" + "="*60)
         print("🎉 Analysis completed successfully!")
@@ -503,20 +1484,1524 @@ Data Quality Issues: {len(self.data_quality_issues)} found
         print("="*60)
 
 
+class GapRulePlan:
+    """
+    A screening rule set (see DEFAULT_GAP_RULES) compiled into one vectorized
+    evaluation over the merged frame.
+    
+    Compiling collects the distinct predicates and gap conditions of all
+    rules, so a predicate such as ['min_age', 40] is evaluated once however
+    many rules use it. Each predicate sets one bit of a per-row predicate
+    mask and each rule keeps the bits it requires, so eligibility for every
+    rule is a single broadcast AND-and-compare over the masks; the gaps are
+    eligibility AND the rule's condition column. Adding a rule that reuses
+    known predicates and conditions therefore costs one more output column,
+    not another pass over the frame.
+    
+    The plan also defines the care gap layout: gap_types lists (code, label,
+    weight) of each rule in rule order, and bit i of a care gap bitmask is
+    gap_types[i]. Rules for codes in CARE_GAP_TYPES default to its label and
+    weight, so DEFAULT_GAP_RULES keeps the CARE_GAP_TYPES layout.
+    """
+    
+    # Argument types of each rule term; lab_out_of_target's target may be left out
+    PREDICATES = {'min_age': (int,), 'max_age': (int,), 'gender': (str,), 'diagnosis': ((str, list),)}
+    CONDITIONS = {'due': (str,), 'no_visit_within': (int,), 'no_lab_within': (str, int),
+                  'lab_out_of_target': (str, (int, float))}
+    OPTIONAL_ARGUMENTS = {'lab_out_of_target': 1}
+    MAX_PREDICATES = 64
+    # Care gaps are stored as uint32 bitmasks with one bit per rule
+    MAX_RULES = 32
+    
+    def __init__(self, definition, codes, labels, weights, senior_age, predicates, conditions,
+                 rule_predicates, rule_conditions):
+        self.definition = definition
+        self.codes = codes
+        self.labels = labels
+        self.weights = weights
+        self.gap_types = [(code, labels[code], weights[code]) for code in codes]
+        self.senior_age = senior_age
+        self.predicates = predicates
+        self.conditions = conditions
+        self.rule_predicates = rule_predicates
+        self.rule_conditions = rule_conditions
+        self.uses_visits = any(kind == 'no_visit_within' for kind, *_ in conditions)
+        self.uses_labs = any(kind in ('no_lab_within', 'lab_out_of_target') for kind, *_ in conditions)
+    
+    @classmethod
+    def compile(cls, definition):
+        """Validate a rule set definition and build its evaluation plan."""
+        defaults = {code: (label, weight) for code, label, weight in CARE_GAP_TYPES}
+        if len(definition['rules']) > cls.MAX_RULES:
+            raise ValueError(f"Rule sets can have at most {cls.MAX_RULES} rules (care gaps are uint32 "
+                             f"bitmasks), not {len(definition['rules'])}")
+        senior_age = definition.get('senior_age', DEFAULT_GAP_RULES['senior_age'])
+        if isinstance(senior_age, bool) or not isinstance(senior_age, int):
+            raise ValueError(f"senior_age must be an integer age, not {senior_age!r}")
+        predicates, conditions = {}, {}
+        codes, labels, weights, rule_predicates, rule_conditions = [], {}, {}, [], []
+        
+        for rule in definition['rules']:
+            code = rule['code']
+            if code in weights:
+                raise ValueError(f"Duplicate rule for '{code}'")
+            if code not in defaults and not ('label' in rule and 'weight' in rule):
+                raise ValueError(f"Rule '{code}' is not a CARE_GAP_TYPES code, so it needs a label and a weight")
+            if 'label' in rule and not isinstance(rule['label'], str):
+                raise ValueError(f"Rule '{code}': label must be a string, not {rule['label']!r}")
+            if 'weight' in rule and (isinstance(rule['weight'], bool) or not isinstance(rule['weight'], int)):
+                raise ValueError(f"Rule '{code}': weight must be an integer, not {rule['weight']!r}")
+            
+            required = 0
+            for predicate in rule.get('when', []):
+                predicate = cls._term(predicate, cls.PREDICATES, code)
+                required |= 1 << predicates.setdefault(predicate, len(predicates))
+            condition = cls._term(rule['gap'], cls.CONDITIONS, code)
+            if condition[0] in ('no_lab_within', 'lab_out_of_target') and condition[1] not in LAB_RULE_TARGETS:
+                raise ValueError(f"Rule '{code}': lab rules support the tests in LAB_RULE_TARGETS, "
+                                 f"not '{condition[1]}'")
+            due_columns = CSV_SCHEMAS['screenings.csv']['dates']
+            if condition[0] == 'due' and condition[1] not in due_columns:
+                raise ValueError(f"Rule '{code}': 'due' takes a screening due date column "
+                                 f"(one of {due_columns}), not '{condition[1]}'")
+            
+            label, weight = defaults.get(code, (None, None))
+            codes.append(code)
+            labels[code] = rule.get('label', label)
+            weights[code] = rule.get('weight', weight)
+            rule_predicates.append(required)
+            rule_conditions.append(conditions.setdefault(condition, len(conditions)))
+        
+        if len(predicates) > cls.MAX_PREDICATES:
+            raise ValueError(f"Rule sets can use at most {cls.MAX_PREDICATES} distinct predicates, "
+                             f"not {len(predicates)}")
+        return cls(definition, codes, labels, weights, senior_age, list(predicates), list(conditions),
+                   np.array(rule_predicates, dtype=np.uint64), np.array(rule_conditions, dtype=np.intp))
+    
+    @classmethod
+    def load(cls, path):
+        """Compile the rule set in a JSON file (same layout as DEFAULT_GAP_RULES)."""
+        with open(path) as f:
+            return cls.compile(json.load(f))
+    
+    @classmethod
+    def _term(cls, term, kinds, code):
+        """A predicate or condition as a hashable tuple, checked against its kind's arguments."""
+        kind, *args = term
+        if kind not in kinds:
+            raise ValueError(f"Rule '{code}': unknown rule term '{kind}' (expected one of {list(kinds)})")
+        types = kinds[kind]
+        required = len(types) - cls.OPTIONAL_ARGUMENTS.get(kind, 0)
+        if not required <= len(args) <= len(types):
+            expected = f"{required}-{len(types)}" if required < len(types) else f"{required}"
+            raise ValueError(f"Rule '{code}': '{kind}' takes {expected} argument(s), got {args}")
+        for arg, arg_type in zip(args, types):
+            # bool is an int subclass, but never a valid age, day count or target
+            if isinstance(arg, bool) or not isinstance(arg, arg_type):
+                raise ValueError(f"Rule '{code}': invalid argument {arg!r} for '{kind}' in {list(term)}")
+            if isinstance(arg, list) and not (arg and all(isinstance(item, str) for item in arg)):
+                raise ValueError(f"Rule '{code}': '{kind}' takes a non-empty list of strings, got {arg!r}")
+        # Lists become tuples, so the term can be shared between rules
+        return (kind, *[tuple(arg) if isinstance(arg, list) else arg for arg in args])
+    
+    def eligible(self, merged_data):
+        """Booleans (rows x rules): every 'when' predicate of the rule holds."""
+        age = merged_data['age']
+        bits = np.zeros(len(merged_data), dtype=np.uint64)
+        for bit, (kind, value) in enumerate(self.predicates):
+            if kind == 'min_age':
+                mask = age >= value
+            elif kind == 'max_age':
+                mask = age <= value
+            elif kind == 'gender':
+                mask = merged_data['gender'] == value
+            elif isinstance(value, tuple):
+                diagnoses = merged_data['primary_diagnosis'].astype(str).str.strip().str.lower()
+                mask = diagnoses.isin([diagnosis.lower() for diagnosis in value])
+            else:
+                pattern = rf'\b{re.escape(value)}\b'
+                mask = merged_data['primary_diagnosis'].astype(str).str.contains(pattern, case=False, regex=True)
+            bits |= mask.fillna(False).to_numpy(dtype=bool).astype(np.uint64) << np.uint64(bit)
+        return (bits[:, None] & self.rule_predicates) == self.rule_predicates
+    
+    def evaluate(self, merged_data, today, visit_index=None, lab_index=None):
+        """
+        Booleans (rows x rules): the gaps of every rule as of `today`.
+        visit_index and lab_index are needed when a condition uses them
+        (see uses_visits and uses_labs).
+        """
+        if self.uses_visits:
+            last_visit = visit_index['last_visit_date'].reindex(merged_data['patient_id'])
+            last_visit = pd.Series(last_visit.to_numpy(), index=merged_data.index)
+        if self.uses_labs:
+            labs = lab_index.reindex(merged_data['patient_id'])
+            labs.index = merged_data.index
+        
+        conditions = np.empty((len(merged_data), len(self.conditions)), dtype=bool)
+        for i, (kind, *args) in enumerate(self.conditions):
+            if kind == 'due':
+                due = merged_data[args[0]]
+                mask = due.isna() | (due < today)
+            elif kind == 'no_visit_within':
+                mask = last_visit.isna() | ((today - last_visit).dt.days > args[0])
+            elif kind == 'no_lab_within':
+                tested = labs[f'{args[0]}_date']
+                mask = tested.isna() | ((today - tested).dt.days > args[1])
+            else:
+                mask = _out_of_target(labs, *args)
+            conditions[:, i] = mask.fillna(False).to_numpy(dtype=bool)
+        
+        return self.eligible(merged_data) & conditions[:, self.rule_conditions]
+
+
+class CareGapStore:
+    """
+    Care gap results as parallel arrays, one entry per flagged patient:
+    
+    - rows: the patient's patients_df index label
+    - gap_mask: bit i set when the patient has gap gap_types[i]
+    - priority: index into PRIORITY_LEVELS
+    
+    gap_types is the (code, label, weight) layout of the rule plan that
+    produced the store (GapRulePlan.gap_types), CARE_GAP_TYPES by default.
+    Patient details are looked up in patients_df when needed instead of being
+    copied per patient, and counts are array reductions over the masks.
+    """
+    
+    def __init__(self, rows=(), gap_mask=(), priority=(), gap_types=CARE_GAP_TYPES):
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.gap_mask = np.asarray(gap_mask, dtype=np.uint32)
+        self.priority = np.asarray(priority, dtype=np.int8)
+        self.gap_types = gap_types
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    @classmethod
+    def concat(cls, stores):
+        stores = list(stores)
+        gap_types = stores[0].gap_types
+        if any(store.gap_types != gap_types for store in stores):
+            raise ValueError("Cannot combine care gaps evaluated with different rule sets")
+        return cls(np.concatenate([store.rows for store in stores]),
+                   np.concatenate([store.gap_mask for store in stores]),
+                   np.concatenate([store.priority for store in stores]), gap_types)
+    
+    def take(self, indexer):
+        """Subset by position: a slice, a boolean mask or an integer array."""
+        return CareGapStore(self.rows[indexer], self.gap_mask[indexer], self.priority[indexer], self.gap_types)
+    
+    def counts(self):
+        """
+        Gap-type and priority counts. Gap types are ordered by the first
+        flagged patient that has them, as the report has always listed them.
+        """
+        labels = [label for _, label, _ in self.gap_types]
+        counts, first_seen = [], []
+        for i in range(len(labels)):
+            has_gap = (self.gap_mask >> i & 1).astype(bool)
+            counts.append(int(np.count_nonzero(has_gap)))
+            first_seen.append(int(has_gap.argmax()) if counts[-1] else 0)
+        order = sorted((first, i) for i, first in enumerate(first_seen) if counts[i] > 0)
+        gap_types = {labels[i]: counts[i] for _, i in order}
+        
+        priority_values = np.bincount(self.priority, minlength=len(PRIORITY_LEVELS))
+        priority_counts = {level: int(priority_values[i]) for i, level in enumerate(PRIORITY_LEVELS)}
+        return gap_types, priority_counts
+    
+    def patient_columns(self, patients_df, columns):
+        """Columns of patients_df for each entry, in store order."""
+        return patients_df[columns].take(patients_df.index.get_indexer(self.rows))
+    
+    def patient_ids(self, patients_df):
+        return self.patient_columns(patients_df, ['patient_id'])['patient_id']
+    
+    def records(self, patients_df):
+        """
+        One dict per patient in the original care_gaps layout, for callers
+        that still want it. Builds Python objects for every patient, so the
+        pipeline itself never calls it.
+        """
+        report = _report_chunk(self, patients_df, {mask: None for mask in np.unique(self.gap_mask).tolist()})
+        records = report.drop(columns=['care_gaps', 'priority']).to_dict('records')
+        for record, mask, priority in zip(records, self.gap_mask.tolist(), self.priority.tolist()):
+            record['gaps'] = _gap_labels(mask, self.gap_types)
+            record['priority'] = PRIORITY_LEVELS[priority]
+        return records
+
+
+class GapAggregates:
+    """
+    Summary counts of one CareGapStore: patients per gap type, priority level,
+    age group, gender and primary diagnosis, plus the age histogram drawn by
+    the charts. Built in one pass over the store's patients, and small enough
+    to send to the chart worker process.
+    """
+    
+    def __init__(self, patients_with_gaps, gap_types, priority_counts, age_groups, age_histogram,
+                 gender_counts, diagnosis_counts):
+        self.patients_with_gaps = patients_with_gaps
+        self.gap_types = gap_types
+        self.priority_counts = priority_counts
+        self.age_groups = age_groups
+        self.age_histogram = age_histogram
+        self.gender_counts = gender_counts
+        self.diagnosis_counts = diagnosis_counts
+    
+    @classmethod
+    def build(cls, care_gaps, patients_df):
+        gap_types, priority_counts = care_gaps.counts()
+        patients = care_gaps.patient_columns(patients_df, ['age', 'gender', 'primary_diagnosis'])
+        
+        ages = patients['age'].astype('float64').to_numpy()
+        known = ~np.isnan(ages)
+        groups = np.where(known, np.searchsorted(AGE_GROUP_BOUNDS, ages, side='right'), len(AGE_GROUP_LABELS))
+        group_counts = np.bincount(groups, minlength=len(AGE_GROUP_LABELS) + 1)
+        age_groups = {label: int(count) for label, count in zip(AGE_GROUP_LABELS, group_counts)}
+        if group_counts[-1]:
+            age_groups['Unknown'] = int(group_counts[-1])
+        
+        return cls(
+            patients_with_gaps=len(care_gaps),
+            gap_types=gap_types,
+            priority_counts=priority_counts,
+            age_groups=age_groups,
+            age_histogram=np.histogram(ages[known], bins=10) if known.any() else None,
+            gender_counts=_value_counts(patients['gender']),
+            diagnosis_counts=_value_counts(patients['primary_diagnosis']),
+        )
+    
+    def to_frame(self):
+        """All counts as one long table: dimension, value, patients."""
+        dimensions = {'total': {'Patients with care gaps': self.patients_with_gaps},
+                      'gap_type': self.gap_types, 'priority': self.priority_counts,
+                      'age_group': self.age_groups, 'gender': self.gender_counts,
+                      'primary_diagnosis': self.diagnosis_counts}
+        return pd.DataFrame([(dimension, value, count) for dimension, counts in dimensions.items()
+                             for value, count in counts.items()],
+                            columns=['dimension', 'value', 'patients'])
+
+
+class CareGapCube:
+    """
+    Care gaps of every patient on several as-of dates (see backtest_care_gaps).
+    
+    gap_mask and priority are (rows x dates) arrays with the CareGapStore
+    layout: bit i of gap_mask is gap_types[i] and priority indexes
+    PRIORITY_LEVELS (meaningful only where gap_mask is non-zero). Rows are
+    identify_care_gaps' merged rows; rows holds their patients_df labels.
+    """
+    
+    def __init__(self, rows, patient_ids, dates, gap_mask, priority, gap_types=CARE_GAP_TYPES):
+        self.rows = rows
+        self.patient_ids = patient_ids
+        self.dates = dates
+        self.gap_mask = gap_mask
+        self.priority = priority
+        self.gap_types = gap_types
+    
+    def _column(self, as_of):
+        matches = np.flatnonzero(self.dates == pd.Timestamp(as_of))
+        if len(matches) == 0:
+            raise KeyError(f"{as_of} is not one of the backtested dates")
+        return matches[0]
+    
+    def store(self, as_of):
+        """The CareGapStore identify_care_gaps(as_of) would have produced."""
+        column = self._column(as_of)
+        flagged = self.gap_mask[:, column] != 0
+        return CareGapStore(self.rows[flagged], self.gap_mask[flagged, column], self.priority[flagged, column],
+                            self.gap_types)
+    
+    def has_gap(self, code):
+        """Rows x dates booleans for one gap type code, indexed by patient_id."""
+        bit = [gap_code for gap_code, _, _ in self.gap_types].index(code)
+        return pd.DataFrame((self.gap_mask >> bit & 1).astype(bool), index=self.patient_ids, columns=self.dates)
+    
+    def gap_counts(self):
+        """Patients with each gap type, one row per as-of date."""
+        return pd.DataFrame({label: (self.gap_mask >> bit & 1).sum(axis=0)
+                             for bit, (_, label, _) in enumerate(self.gap_types)}, index=self.dates)
+    
+    def priority_counts(self):
+        """Patients with care gaps per priority level, one row per as-of date."""
+        flagged = self.gap_mask != 0
+        return pd.DataFrame({level: (flagged & (self.priority == code)).sum(axis=0)
+                             for code, level in enumerate(PRIORITY_LEVELS)}, index=self.dates)
+
+
+class StageProfiler:
+    """
+    Records wall time, CPU time, peak RSS and row counts for pipeline stages.
+    
+    Each stage is a dict in self.stages. CPU time includes finished child
+    processes, so sharded stages account for their workers. Peak RSS is the
+    process high-water mark after the stage; peak_rss_growth_mb is how much
+    the stage raised it.
+    """
+    
+    def __init__(self, processor, profile_stage=None):
+        self.processor = processor
+        self.profile_stage = profile_stage
+        self.started_at = datetime.now()
+        self.stages = []
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one stage."""
+        rows_in = self.processor.row_counts()
+        peak_before = _peak_rss_mb()
+        profile = cProfile.Profile() if name == self.profile_stage else None
+        cpu_start = _cpu_seconds()
+        wall_start = time.perf_counter()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = _cpu_seconds() - cpu_start
+            peak_after = _peak_rss_mb()
+            self.stages.append({
+                'stage': name,
+                'wall_s': round(wall, 4),
+                'cpu_s': round(cpu, 4),
+                'peak_rss_mb': peak_after,
+                'peak_rss_growth_mb': None if peak_after is None else round(peak_after - peak_before, 1),
+                'rows_in': rows_in,
+                'rows_out': self.processor.row_counts(),
+            })
+            if name == 'load_data' and self.processor.load_timings:
+                self.stages[-1]['file_wall_s'] = dict(self.processor.load_timings)
+            if profile:
+                self._save_profile(name, profile)
+    
+    def run(self, name, func, *args, **kwargs):
+        """Call func as one stage and return its result."""
+        with self.stage(name):
+            return func(*args, **kwargs)
+    
+    def _save_profile(self, name, profile):
+        path = f'{name}.prof'
+        profile.dump_stats(path)
+        self.stages[-1]['cprofile'] = path
+        print(f"\ncProfile of {name} (top 15 by cumulative time, full stats in '{path}'):")
+        pstats.Stats(profile).sort_stats('cumulative').print_stats(15)
+    
+    def to_dict(self):
+        return {
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'total_wall_s': round(sum(stage['wall_s'] for stage in self.stages), 4),
+            'total_cpu_s': round(sum(stage['cpu_s'] for stage in self.stages), 4),
+            'stages': self.stages,
+        }
+    
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        print(f"✓ Run profile saved to '{path}'")
+    
+    def print_summary(self):
+        print("\n" + "="*50)
+        print("STAGE TIMINGS")
+        print("="*50)
+        print(f"{'Stage':<26} {'Wall (s)':>9} {'CPU (s)':>9} {'Peak RSS (MB)':>14}")
+        for stage in self.stages:
+            peak = '' if stage['peak_rss_mb'] is None else f"{stage['peak_rss_mb']:.1f}"
+            print(f"{stage['stage']:<26} {stage['wall_s']:>9.3f} {stage['cpu_s']:>9.3f} {peak:>14}")
+
+
+class StageCheckpoints:
+    """
+    Runs the PIPELINE_STAGES DAG, persisting what each stage did so a later run
+    can skip it.
+    
+    Each stage gets a key from its parameters, the keys of its upstream
+    stages, and the pipeline source (clean_data also from the source files'
+    fingerprints), so a change anywhere upstream invalidates everything
+    downstream. After a stage succeeds, its checkpointed attributes are
+    pickled to <checkpoint_dir>/<stage>.pkl and its key is recorded in
+    checkpoints.json. A stage is fresh while its key matches and its artifact
+    and output files exist.
+    
+    Without a checkpoint_dir nothing is persisted and every stage runs.
+    """
+    
+    def __init__(self, checkpoint_dir=None, params=None, outputs=None):
+        self.checkpoint_dir = checkpoint_dir
+        self.outputs = outputs or {}
+        self.manifest_path = checkpoint_dir and os.path.join(checkpoint_dir, 'checkpoints.json')
+        self.completed = set()
+        self.keys = self._stage_keys(params or {}) if checkpoint_dir else {}
+    
+    def _stage_keys(self, params):
+        sources = CleanedDataCache(self.checkpoint_dir).fingerprint()
+        code = _file_sha256(os.path.abspath(__file__))
+        keys = {}
+        for name, (upstream, _) in PIPELINE_STAGES.items():
+            inputs = {'code': code, 'upstream': [keys[stage] for stage in upstream], 'params': params.get(name)}
+            if name == 'clean_data':
+                inputs['sources'] = sources
+            keys[name] = hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()[:32]
+        return keys
+    
+    def run(self, processor, runners, stages=None, bundled=None):
+        """
+        Run the stages that have a runner, in PIPELINE_STAGES order.
+        
+        By default stages with a fresh checkpoint are skipped. With `stages`,
+        only those run (fresh or not). Upstream outputs a running stage needs
+        are restored from their checkpoints, or recomputed when stale.
+        bundled maps a stage to the stages its runner completes as well.
+        """
+        for name in PIPELINE_STAGES:
+            if name not in runners or name in self.completed or (stages and name not in stages):
+                continue
+            if not stages and self.is_fresh(name):
+                print(f"\n✓ {name} is up to date (checkpoint {self.keys[name][:12]}), skipped")
+                continue
+            self._run(processor, name, runners, bundled or {})
+    
+    def _run(self, processor, name, runners, bundled):
+        for upstream in PIPELINE_STAGES[name][0]:
+            if upstream in self.completed:
+                continue
+            if self.is_fresh(upstream):
+                self.restore(processor, upstream)
+            else:
+                self._run(processor, upstream, runners, bundled)
+        
+        runners[name]()
+        for stage in [name] + bundled.get(name, []):
+            self.save(processor, stage)
+    
+    def is_fresh(self, name):
+        if self.checkpoint_dir is None:
+            return False
+        entry = self._read_manifest().get(name)
+        if entry is None or entry['key'] != self.keys[name]:
+            return False
+        paths = list(self.outputs.get(name, []))
+        if PIPELINE_STAGES[name][1]:
+            paths.append(self._artifact_path(name))
+        return all(path and os.path.exists(path) for path in paths)
+    
+    def restore(self, processor, name):
+        """Load a stage's checkpointed attributes into the processor."""
+        for attribute, value in pd.read_pickle(self._artifact_path(name)).items():
+            setattr(processor, attribute, value)
+        self.completed.add(name)
+        print(f"✓ Restored {name} outputs from checkpoint {self.keys[name][:12]}")
+    
+    def save(self, processor, name):
+        """Checkpoint a stage that just completed."""
+        self.completed.add(name)
+        if self.checkpoint_dir is None:
+            return
+        
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        attributes = PIPELINE_STAGES[name][1]
+        if attributes:
+            # Write to a temporary file first so a failed run never leaves a partial artifact
+            path = self._artifact_path(name)
+            pd.to_pickle({attribute: getattr(processor, attribute) for attribute in attributes}, path + '.tmp')
+            os.replace(path + '.tmp', path)
+        
+        manifest = self._read_manifest()
+        manifest[name] = {'key': self.keys[name], 'completed_at': datetime.now().isoformat(timespec='seconds')}
+        with open(self.manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+    
+    def _artifact_path(self, name):
+        return os.path.join(self.checkpoint_dir, f'{name}.pkl')
+    
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+
+class PatientStore:
+    """
+    Cleaned tables sorted by patient_id in uncompressed Feather (Arrow IPC)
+    files, opened memory-mapped, plus an offset index.
+    
+    offsets.feather has one row per patient_id (sorted) with the [start, stop)
+    row range of that patient in every table, so one patient's rows are a
+    binary search and a zero-copy Arrow slice; only the slice is converted to
+    pandas. patient_id_map.feather keeps the record linkage mapping, so ids
+    of linked duplicates resolve to their canonical patient.
+    """
+    
+    TABLES = ['patients_df', 'screening_df', 'visits_df', 'lab_results_df']
+    
+    def __init__(self, store_dir=DEFAULT_PATIENT_STORE_DIR):
+        if feather is None:
+            raise ImportError("The patient store requires pyarrow")
+        self.store_dir = store_dir
+        self.tables = {table: feather.read_table(os.path.join(store_dir, f'{table}.feather'), memory_map=True)
+                       for table in self.TABLES}
+        offsets = feather.read_table(os.path.join(store_dir, 'offsets.feather'), memory_map=True)
+        self.patient_ids = offsets.column('patient_id').to_numpy(zero_copy_only=False).astype(str)
+        self.offsets = {table: (offsets.column(f'{table}_start').to_numpy(),
+                                offsets.column(f'{table}_stop').to_numpy())
+                        for table in self.TABLES}
+        self.patient_id_map = _read_patient_id_map(os.path.join(store_dir, 'patient_id_map.feather'))
+    
+    @classmethod
+    def write(cls, store_dir, tables, patient_id_map=None):
+        """
+        Sort each table by patient_id and write it with the offset index and
+        the patient_id_map of record linkage. Rows without a patient_id cannot
+        be looked up and are left out.
+        """
+        if feather is None:
+            raise ImportError("The patient store requires pyarrow")
+        
+        sorted_tables = {}
+        for table, df in tables.items():
+            df = df.dropna(subset=['patient_id'])
+            df = df.assign(patient_id=df['patient_id'].astype(str))
+            sorted_tables[table] = df.sort_values('patient_id', kind='stable', ignore_index=True)
+        
+        patient_ids = np.unique(np.concatenate([df['patient_id'].to_numpy(dtype=str)
+                                                for df in sorted_tables.values()]))
+        offsets = {'patient_id': patient_ids}
+        for table, df in sorted_tables.items():
+            table_ids = df['patient_id'].to_numpy(dtype=str)
+            offsets[f'{table}_start'] = np.searchsorted(table_ids, patient_ids, side='left')
+            offsets[f'{table}_stop'] = np.searchsorted(table_ids, patient_ids, side='right')
+        
+        # Write to a temporary directory first so readers never see a partial store
+        tmp_dir = store_dir.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for table, df in sorted_tables.items():
+            feather.write_feather(df, os.path.join(tmp_dir, f'{table}.feather'), compression='uncompressed')
+        feather.write_feather(pd.DataFrame(offsets), os.path.join(tmp_dir, 'offsets.feather'),
+                              compression='uncompressed')
+        _write_patient_id_map(patient_id_map, os.path.join(tmp_dir, 'patient_id_map.feather'))
+        shutil.rmtree(store_dir, ignore_errors=True)
+        os.replace(tmp_dir, store_dir)
+    
+    def positions(self, patient_ids):
+        """Offset-index positions of the given patient_ids; unknown ids are skipped."""
+        wanted = np.asarray(list(dict.fromkeys(patient_ids)), dtype=str)
+        if len(wanted) == 0 or len(self.patient_ids) == 0:
+            return np.array([], dtype=np.int64)
+        positions = np.searchsorted(self.patient_ids, wanted).clip(max=len(self.patient_ids) - 1)
+        return positions[self.patient_ids[positions] == wanted]
+    
+    def history(self, patient_id, table):
+        """One patient's rows of one table, as a zero-copy Arrow slice."""
+        positions = self.positions([patient_id])
+        if len(positions) == 0:
+            return self.tables[table].slice(0, 0)
+        starts, stops = self.offsets[table]
+        return self.tables[table].slice(starts[positions[0]], stops[positions[0]] - starts[positions[0]])
+    
+    def lookup(self, patient_ids):
+        """Rows of every table for the given patient_ids, as pandas frames."""
+        positions = self.positions(patient_ids)
+        frames = {}
+        for table, (starts, stops) in self.offsets.items():
+            slices = [self.tables[table].slice(starts[p], stops[p] - starts[p]) for p in positions]
+            arrow_table = pa.concat_tables(slices) if slices else self.tables[table].slice(0, 0)
+            frames[table] = arrow_table.to_pandas()
+        return frames
+
+
+class CleanedDataCache:
+    """
+    On-disk cache of the cleaned tables in Feather (Arrow IPC) format.
+    
+    Entries are keyed by the size, mtime and content hash of the source CSVs
+    and by the hash of this module, so a change to the cleaning code never
+    serves tables cleaned by the old code. Content hashes are remembered in a
+    manifest, so files whose size and mtime are unchanged are not re-hashed on
+    every run. The patient_id_map of record linkage is cached with the tables.
+    """
+    
+    TABLES = ['patients_df', 'visits_df', 'screening_df', 'lab_results_df']
+    
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, source_files=SOURCE_FILES):
+        self.cache_dir = cache_dir
+        self.source_files = source_files
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+    
+    def fingerprint(self):
+        """
+        Return the cache key for the current source files, or None if one is missing.
+        """
+        manifest = self._read_manifest()
+        fingerprints = {}
+        
+        for path in self.source_files:
+            if not os.path.exists(path):
+                return None
+            stat = os.stat(path)
+            known = manifest.get(path)
+            if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+                sha256 = known['sha256']
+            else:
+                sha256 = _file_sha256(path)
+            fingerprints[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        
+        self._write_manifest(fingerprints)
+        key_source = ''.join(f"{path}:{fingerprints[path]['sha256']};" for path in self.source_files)
+        key_source += f"code:{_file_sha256(os.path.abspath(__file__))}"
+        return hashlib.sha256(key_source.encode()).hexdigest()[:32]
+    
+    def load(self, processor):
+        """
+        Load cached cleaned tables into the processor. Returns True on a cache hit.
+        """
+        if feather is None:
+            print("⚠️  pyarrow is not installed; cleaned-data cache disabled")
+            return False
+        
+        key = self.fingerprint()
+        entry_dir = os.path.join(self.cache_dir, key) if key else None
+        if entry_dir is None or not os.path.isdir(entry_dir):
+            return False
+        
+        for table in self.TABLES:
+            path = os.path.join(entry_dir, f'{table}.feather')
+            setattr(processor, table, feather.read_table(path, memory_map=True).to_pandas())
+        processor.patient_id_map = _read_patient_id_map(os.path.join(entry_dir, 'patient_id_map.feather'))
+        
+        print(f"✓ Loaded cleaned data from cache ({key})")
+        return True
+    
+    def save(self, processor):
+        """
+        Save the processor's cleaned tables under the current source fingerprint.
+        """
+        if feather is None:
+            return
+        
+        key = self.fingerprint()
+        if key is None:
+            return
+        
+        # Write to a temporary directory first so a failed run never leaves a partial entry
+        entry_dir = os.path.join(self.cache_dir, key)
+        tmp_dir = entry_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for table in self.TABLES:
+            df = getattr(processor, table).reset_index(drop=True)
+            feather.write_feather(df, os.path.join(tmp_dir, f'{table}.feather'), compression='uncompressed')
+        _write_patient_id_map(processor.patient_id_map, os.path.join(tmp_dir, 'patient_id_map.feather'))
+        
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        print(f"✓ Cleaned data cached in '{entry_dir}'")
+    
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def _write_manifest(self, fingerprints):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.manifest_path, 'w') as f:
+            json.dump(fingerprints, f, indent=2)
+
+
+class CareGapService:
+    """
+    Answers care gap queries per patient_id from warm in-memory state.
+    
+    reload() loads, cleans and evaluates the data once, keeping the
+    processor's visit and lab indexes and care gap store, plus a patient_id
+    lookup into them. query() answers from that state through an LRU cache.
+    Cache keys include the data generation, so a reload invalidates every
+    cached answer even for queries that were in flight while it ran.
+    """
+    
+    def __init__(self, data_dir='.', cache_size=DEFAULT_SERVICE_CACHE_SIZE, gap_rules=None):
+        self.data_dir = data_dir
+        self.gap_rules = gap_rules
+        self.generation = 0
+        self.reload_seconds = None
+        self.processor = None
+        self._state = None
+        self._reload_lock = threading.Lock()
+        self._cached_query = functools.lru_cache(maxsize=cache_size)(self._query)
+        self.reload()
+    
+    def reload(self):
+        """Rebuild the state from the source files, then swap it in."""
+        with self._reload_lock:
+            start = time.perf_counter()
+            processor = HealthcareDataProcessor(self.gap_rules)
+            with contextlib.redirect_stdout(io.StringIO()):
+                processor.load_data(data_dir=self.data_dir)
+                processor.clean_data()
+                processor.identify_care_gaps()
+            
+            patients = processor.patients_df.dropna(subset=['patient_id'])
+            gap_ids = processor.care_gaps.patient_ids(processor.patients_df).astype(str).to_numpy()
+            first_gap = ~pd.Series(gap_ids).duplicated().to_numpy()
+            state = {
+                'patients': patients.set_index(patients['patient_id'].astype(str)),
+                'patient_id_map': processor.patient_id_map,
+                'gap_positions': pd.Series(np.flatnonzero(first_gap), index=gap_ids[first_gap]),
+                'care_gaps': processor.care_gaps,
+                'evaluated_at': processor.gaps_evaluated_at.isoformat(timespec='seconds'),
+            }
+            
+            self.processor = processor
+            self._state = state
+            self.generation += 1
+            self._cached_query.cache_clear()
+            self.reload_seconds = round(time.perf_counter() - start, 4)
+    
+    def query(self, patient_id):
+        """
+        Care gaps of one patient as a JSON-ready dict, or None for an unknown
+        patient_id. Patients without gaps have an empty gaps list and no priority.
+        The patient_id of a linked duplicate answers for its canonical patient.
+        """
+        return self._cached_query(str(patient_id), self.generation)
+    
+    def _query(self, patient_id, generation):
+        state = self._state
+        patient_id = state['patient_id_map'].get(patient_id, patient_id)
+        if patient_id not in state['patients'].index:
+            return None
+        
+        patient = state['patients'].loc[patient_id]
+        answer = {
+            'patient_id': patient_id,
+            'name': f"{patient['first_name']} {patient['last_name']}",
+            'age': None if pd.isna(patient['age']) else int(patient['age']),
+            'gender': None if pd.isna(patient['gender']) else str(patient['gender']),
+            'phone': None if pd.isna(patient['phone']) else str(patient['phone']),
+            'gaps': [],
+            'priority': None,
+            'evaluated_at': state['evaluated_at'],
+        }
+        if patient_id in state['gap_positions'].index:
+            position = state['gap_positions'].loc[patient_id]
+            answer['gaps'] = _gap_labels(int(state['care_gaps'].gap_mask[position]), state['care_gaps'].gap_types)
+            answer['priority'] = PRIORITY_LEVELS[state['care_gaps'].priority[position]]
+        return answer
+    
+    def status(self):
+        state = self._state
+        return {
+            'status': 'ok',
+            'generation': self.generation,
+            'patients': len(state['patients']),
+            'patients_with_gaps': len(state['care_gaps']),
+            'evaluated_at': state['evaluated_at'],
+            'reload_seconds': self.reload_seconds,
+            'cache': self._cached_query.cache_info()._asdict(),
+        }
+    
+    def make_server(self, host=DEFAULT_SERVICE_HOST, port=DEFAULT_SERVICE_PORT):
+        """
+        HTTP server for this service (call serve_forever on it). Routes:
+        GET /care-gaps/<patient_id>, GET /health and POST /reload.
+        """
+        handler = type('CareGapRequestHandler', (_CareGapRequestHandler,), {'service': self})
+        return ThreadingHTTPServer((host, port), handler)
+
+
+class _CareGapRequestHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP/1.1 keep-alive for CareGapService."""
+    
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without TCP_NODELAY every
+    # keep-alive response waits out the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+    service = None
+    
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, self.service.status())
+        elif self.path.startswith('/care-gaps/'):
+            answer = self.service.query(unquote(self.path[len('/care-gaps/'):]))
+            if answer is None:
+                self._send(404, {'error': 'unknown patient_id'})
+            else:
+                self._send(200, answer)
+        else:
+            self._send(404, {'error': 'not found'})
+    
+    def do_POST(self):
+        if self.path == '/reload':
+            self.service.reload()
+            self._send(200, self.service.status())
+        else:
+            self._send(404, {'error': 'not found'})
+    
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
 def main():
     """
     Main function to run the healthcare data analysis.
+    With --serve, run the care gap query service instead of the batch analysis.
     """
+    parser = argparse.ArgumentParser(description="Healthcare Data Pipeline")
+    parser.add_argument('--serve', action='store_true', help='run the care gap query service')
+    parser.add_argument('--host', default=DEFAULT_SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_SERVICE_PORT)
+    parser.add_argument('--data-dir', default='.', help='directory with the source CSVs (service mode)')
+    parser.add_argument('--as-of', help='evaluate care gaps as of this date (YYYY-MM-DD) instead of today')
+    parser.add_argument('--checkpoint-dir', help='resume from, and checkpoint stages to, this directory')
+    parser.add_argument('--stage', action='append', choices=list(PIPELINE_STAGES),
+                        help='run only this stage against checkpointed upstream outputs (repeatable)')
+    parser.add_argument('--rules', help='screening rule set JSON (layout of DEFAULT_GAP_RULES)')
+    args = parser.parse_args()
+    if args.stage and not args.checkpoint_dir:
+        parser.error('--stage needs --checkpoint-dir')
+    
+    gap_rules = GapRulePlan.load(args.rules) if args.rules else None
+    
+    if args.serve:
+        service = CareGapService(args.data_dir, gap_rules=gap_rules)
+        server = service.make_server(args.host, args.port)
+        print(f"🏥 Care gap service on http://{args.host}:{server.server_port} "
+              f"({service.status()['patients']} patients, loaded in {service.reload_seconds:.2f}s)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+        return
+    
     # TODO: Create an instance of HealthcareDataProcessor
-    processor = HealthcareDataProcessor()
+    processor = HealthcareDataProcessor(gap_rules)
     
     # TODO: Run the full analysis
-    processor.run_full_analysis()
+    try:
+        processor.run_full_analysis(as_of=args.as_of, checkpoint_dir=args.checkpoint_dir, stages=args.stage)
+    except FileNotFoundError as e:
+        print(f"❌ Error loading file: {e}")
+        sys.exit(1)
     
     print("\nThank you for using the Healthcare Data Pipeline!")
 
 
 # Helper functions (optional - implement if needed)
+def read_csv_with_schema(path, table=None, **kwargs):
+    """
+    Read one of the source CSVs with its declared dtypes and ISO date parsing.
+    table names its CSV_SCHEMAS entry (e.g. 'visits.csv' for a visits delta
+    file); by default it is the file name. Extra keyword arguments (chunksize,
+    nrows, ...) are passed to pd.read_csv.
+    """
+    schema = CSV_SCHEMAS.get(table or os.path.basename(path), {})
+    return pd.read_csv(path, dtype=schema.get('dtype'), parse_dates=schema.get('dates'),
+                       date_format=ISO_DATE_FORMAT, **kwargs)
+
+
+def _chunk_rows(path, memory_limit_mb, sample_rows=10000):
+    """
+    Pick a CSV chunk size that keeps a parsed chunk well under the memory limit.
+    Row size is estimated from a sample; a quarter of the limit is left for the
+    chunk itself to leave room for parsing buffers and the running aggregates.
+    """
+    sample = pd.read_csv(path, nrows=sample_rows)
+    if len(sample) == 0:
+        return sample_rows
+    bytes_per_row = sample.memory_usage(deep=True).sum() / len(sample)
+    budget = memory_limit_mb * 1024 * 1024 / 4
+    return max(1000, int(budget / bytes_per_row))
+
+
+def _aggregate_visits(visits):
+    """
+    Aggregate visits per patient_id. Keeps the date of the visit that supplied
+    last_visit_type so that partial aggregates can be combined exactly.
+    """
+    grouped = visits.groupby('patient_id', observed=True)
+    aggregates = pd.DataFrame({
+        'last_visit_date': grouped['visit_date'].max(),
+        'visit_count': grouped.size(),
+        'next_appointment': grouped['next_appointment'].max(),
+    })
+    aggregates.index = aggregates.index.astype(str)
+    return aggregates.join(_last_visit_types(visits['patient_id'], visits['visit_date'],
+                                             visits['visit_type']))
+
+
+def _combine_visit_aggregates(running, partial):
+    """
+    Combine two visit aggregates; partial must come from rows later in the file.
+    """
+    combined = pd.concat([running, partial])
+    grouped = combined.groupby(level=0)
+    aggregates = pd.DataFrame({
+        'last_visit_date': grouped['last_visit_date'].max(),
+        'visit_count': grouped['visit_count'].sum(),
+        'next_appointment': grouped['next_appointment'].max(),
+    })
+    return aggregates.join(_last_visit_types(combined.index.to_series(), combined['last_visit_type_date'],
+                                             combined['last_visit_type']))
+
+
+def _last_visit_types(patient_ids, visit_dates, visit_types):
+    """
+    Visit type of the latest dated visit per patient, ties going to the later row.
+    """
+    frame = pd.DataFrame({
+        'patient_id': patient_ids.to_numpy(),
+        'last_visit_type_date': visit_dates.to_numpy(),
+        'last_visit_type': visit_types.to_numpy(),
+    }).dropna(subset=['last_visit_type'])
+    frame = frame.sort_values('last_visit_type_date', na_position='first', kind='stable')
+    return frame.drop_duplicates(subset=['patient_id'], keep='last').set_index('patient_id')
+
+
+def render_care_gap_chart(aggregates, path, show=False):
+    """
+    Render the 2x2 care gap chart from GapAggregates and save it.
+    Without show, the figure is drawn on the non-interactive Agg canvas, so it
+    works on headless workers and inside a background process.
+    """
+    if show:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(15, 10))
+    else:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(15, 10))
+        FigureCanvasAgg(fig)
+    
+    # Create figure with subplots for multiple charts
+    ((ax1, ax2), (ax3, ax4)) = fig.subplots(2, 2)
+    fig.suptitle('Healthcare Care Gap Analysis', fontsize=16)
+    
+    # 1. Gap types bar chart
+    gap_types = aggregates.gap_types
+    ax1.bar(gap_types.keys(), gap_types.values(), color='skyblue')
+    ax1.set_title('Care Gaps by Type')
+    ax1.set_ylabel('Number of Patients')
+    ax1.tick_params(axis='x', rotation=45)
+    
+    # 2. Priority levels pie chart
+    priority_counts = aggregates.priority_counts
+    if sum(priority_counts.values()) > 0:
+        ax2.pie(priority_counts.values(), labels=priority_counts.keys(), autopct='%1.1f%%')
+        ax2.set_title('Care Gaps by Priority Level')
+    
+    # 3. Age distribution of patients with gaps
+    if aggregates.age_histogram is not None:
+        counts, edges = aggregates.age_histogram
+        ax3.hist(edges[:-1], bins=edges, weights=counts, color='lightgreen', alpha=0.7)
+    ax3.set_title('Age Distribution of Patients with Care Gaps')
+    ax3.set_xlabel('Age')
+    ax3.set_ylabel('Number of Patients')
+    
+    # 4. Gender breakdown of patients with gaps
+    gender_counts = aggregates.gender_counts
+    if gender_counts:
+        ax4.bar(gender_counts.keys(), gender_counts.values(), color='orange')
+        ax4.set_title('Care Gaps by Gender')
+        ax4.set_ylabel('Number of Patients')
+    
+    fig.tight_layout()
+    fig.savefig(path, dpi=300, bbox_inches='tight')
+    if show:
+        plt.show()
+
+
+def _check_aggregates_as_of(as_of, *indexes):
+    """
+    Raise ValueError when a visit or lab index (None to skip) holds a visit
+    or rule lab result dated after as_of: an aggregate only keeps the latest
+    record, so the one current as of that date is gone.
+    """
+    latest = []
+    for index in indexes:
+        if index is not None:
+            date_columns = ['last_visit_date'] if 'last_visit_date' in index else [
+                f'{test}_date' for test in LAB_RULE_TARGETS]
+            latest += [index[col].max() for col in date_columns]
+    latest = max([date for date in latest if pd.notna(date)], default=None)
+    if latest is not None and latest > as_of:
+        raise ValueError(f"Cannot evaluate care gaps as of {as_of:%Y-%m-%d}: the visit and lab aggregates "
+                         f"include records up to {latest:%Y-%m-%d}, and streamed runs and saved gap states "
+                         "keep only the latest records. Load the data in memory to evaluate an earlier date.")
+
+
+def _wide_lab_index(latest):
+    """
+    One row per patient_id with the date, value and status of the latest result
+    of each test in LAB_RULE_TARGETS, from _latest_lab_results output.
+    """
+    columns = [f'{test}_{field}' for test in LAB_RULE_TARGETS for field in ['date', 'value', 'status']]
+    if latest is None:
+        latest = pd.DataFrame(columns=['patient_id', 'test_type', 'test_date', 'result_value', 'status'])
+    
+    latest = latest[latest['test_type'].isin(list(LAB_RULE_TARGETS))].dropna(subset=['patient_id'])
+    wide = pd.DataFrame({
+        'patient_id': latest['patient_id'].astype(str).to_numpy(),
+        'test_type': latest['test_type'].astype(str).to_numpy(),
+        'date': latest['test_date'].to_numpy(),
+        'value': pd.to_numeric(latest['result_value'], errors='coerce').to_numpy(),
+        'status': latest['status'].astype(object).to_numpy(),
+    }).set_index(['patient_id', 'test_type']).unstack('test_type')
+    wide.columns = [f'{test}_{field}' for field, test in wide.columns]
+    lab_index = wide.reindex(columns=columns)
+    
+    # Keep the rule dtypes even when a test has no results (or there are no labs at all)
+    for test in LAB_RULE_TARGETS:
+        lab_index[f'{test}_date'] = pd.to_datetime(lab_index[f'{test}_date'])
+        lab_index[f'{test}_value'] = lab_index[f'{test}_value'].astype('float64')
+    return lab_index
+
+
+def _lab_index_results(lab_index):
+    """
+    The results held by a lab index, back in _latest_lab_results layout (one
+    row per patient and test), so new results can be folded into it.
+    """
+    results = []
+    for test in LAB_RULE_TARGETS:
+        fields = lab_index[[f'{test}_date', f'{test}_value', f'{test}_status']]
+        fields.columns = ['test_date', 'result_value', 'status']
+        fields = fields[fields.notna().any(axis=1)]
+        results.append(fields.assign(test_type=test).rename_axis('patient_id').reset_index())
+    return pd.concat(results, ignore_index=True)
+
+
+def _date_coverage(keys, starts, stops, dates, n_keys):
+    """
+    Booleans of shape (n_keys + 1, len(dates)): True where one of the key's
+    [start, stop) intervals covers the date. dates must be sorted. Intervals
+    with key -1 are skipped and the extra last row stays False, so rows can
+    be looked up with pd.Index.get_indexer codes (-1 for missing).
+    """
+    keep = keys >= 0
+    width = len(dates) + 1
+    offsets = keys[keep] * width
+    first = offsets + np.searchsorted(dates, starts[keep], side='left')
+    last = offsets + np.searchsorted(dates, stops[keep], side='left')
+    size = (n_keys + 1) * width
+    changes = np.bincount(first, minlength=size) - np.bincount(last, minlength=size)
+    return changes.reshape(n_keys + 1, width).cumsum(axis=1)[:, :-1] > 0
+
+
+def _out_of_target(labs, test, target=None):
+    """
+    Latest result of `test` is out of target: flagged by the lab, or with no
+    status and a value at or above target (LAB_RULE_TARGETS[test] by default).
+    """
+    status = labs[f'{test}_status']
+    value = labs[f'{test}_value']
+    flagged = status.isin(OUT_OF_TARGET_STATUSES)
+    return flagged | (status.isna() & (value >= (LAB_RULE_TARGETS[test] if target is None else target)))
+
+
+def export_care_gaps(care_gaps, patients_df, path, fmt='csv', partition_by=None,
+                     chunk_rows=DEFAULT_EXPORT_CHUNK_ROWS):
+    """
+    Write a CareGapStore as a report with REPORT_COLUMNS, chunk by chunk.
+    
+    Only one chunk of report rows is formatted at a time, and the gap label
+    string is built once per distinct gap pattern. Without partition_by, path
+    is the output file. With partition_by='priority' each priority goes to
+    path/priority=<High|Medium|Low><ext>; with 'gap_type' each gap type goes
+    to path/gap_type=<code><ext>, so a patient appears in one file per gap.
+    Partitions are written to a temporary directory that then replaces path,
+    so no partition of an earlier export is left behind. Returns the paths
+    written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {list(EXPORT_FORMATS)}")
+    if partition_by not in (None, 'priority', 'gap_type'):
+        raise ValueError(f"Unknown partition {partition_by!r}; expected 'priority' or 'gap_type'")
+    if fmt == 'parquet' and pq is None:
+        raise ImportError("Parquet export requires pyarrow")
+    
+    pattern_labels = {mask: ', '.join(_gap_labels(mask, care_gaps.gap_types))
+                      for mask in np.unique(care_gaps.gap_mask).tolist()}
+    out_dir = path
+    if partition_by:
+        out_dir = path.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.makedirs(out_dir)
+    
+    writers = {}
+    try:
+        for start in range(0, max(len(care_gaps), 1), chunk_rows):
+            chunk = care_gaps.take(slice(start, start + chunk_rows))
+            report = _report_chunk(chunk, patients_df, pattern_labels)
+            for key, rows in _partition_report(chunk, report, partition_by):
+                if key not in writers:
+                    target = (path if key is None
+                              else os.path.join(out_dir, f'{partition_by}={key}{EXPORT_FORMATS[fmt]}'))
+                    writers[key] = _ReportWriter(target, fmt)
+                writers[key].write(rows)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    
+    if not partition_by:
+        return [writer.path for writer in writers.values()]
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(out_dir, path)
+    return [os.path.join(path, os.path.basename(writer.path)) for writer in writers.values()]
+
+
+def _report_chunk(chunk, patients_df, pattern_labels):
+    """Report rows for one chunk of a CareGapStore."""
+    patients = chunk.patient_columns(patients_df, ['patient_id', 'first_name', 'last_name',
+                                                   'age', 'gender', 'phone', 'email'])
+    return pd.DataFrame({
+        'patient_id': patients['patient_id'].array,
+        'name': (patients['first_name'].astype(str) + ' ' + patients['last_name'].astype(str)).array,
+        'age': patients['age'].array,
+        'gender': patients['gender'].astype(object).array,
+        'phone': patients['phone'].array,
+        'email': patients['email'].array,
+        'care_gaps': [pattern_labels[mask] for mask in chunk.gap_mask.tolist()],
+        'priority': np.array(PRIORITY_LEVELS, dtype=object)[chunk.priority],
+    })
+
+
+def _partition_report(chunk, report, partition_by):
+    """Yield (partition key, report rows) for one chunk."""
+    if partition_by is None:
+        yield None, report
+    elif partition_by == 'priority':
+        for code, priority in enumerate(PRIORITY_LEVELS):
+            rows = report[chunk.priority == code]
+            if len(rows):
+                yield priority, rows
+    else:
+        for i, (code, _, _) in enumerate(chunk.gap_types):
+            rows = report[(chunk.gap_mask >> i & 1).astype(bool)]
+            if len(rows):
+                yield code, rows
+
+
+class _ReportWriter:
+    """
+    Appends report chunks to one output file in one of EXPORT_FORMATS.
+    """
+    
+    PARQUET_SCHEMA = None if pa is None else pa.schema(
+        [('patient_id', pa.string()), ('name', pa.string()), ('age', pa.int16()),
+         ('gender', pa.string()), ('phone', pa.string()), ('email', pa.string()),
+         ('care_gaps', pa.string()), ('priority', pa.string())])
+    
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.header = True
+        if fmt == 'parquet':
+            self.file = pq.ParquetWriter(path, self.PARQUET_SCHEMA, compression='zstd')
+        elif fmt == 'csv.gz':
+            self.file = gzip.open(path, 'wt', newline='')
+        else:
+            self.file = open(path, 'w', newline='')
+    
+    def write(self, rows):
+        if self.fmt == 'parquet':
+            self.file.write_table(pa.Table.from_pandas(rows, schema=self.PARQUET_SCHEMA, preserve_index=False))
+        elif self.fmt == 'ndjson':
+            if len(rows):
+                text = rows.to_json(orient='records', lines=True, force_ascii=False)
+                self.file.write(text if text.endswith('\n') else text + '\n')
+        else:
+            rows.to_csv(self.file, header=self.header, index=False)
+        self.header = False
+    
+    def close(self):
+        self.file.close()
+
+
+def _priority_levels(priority_score):
+    """Priority scores as PRIORITY_LEVELS indexes: 3+ High, 2 Medium, else Low."""
+    return np.select([priority_score >= 3, priority_score >= 2], [0, 1], default=2).astype(np.int8)
+
+
+def _as_of_datetime(as_of):
+    """An as-of date (date, datetime, Timestamp or string) as a datetime."""
+    return pd.Timestamp(as_of).to_pydatetime()
+
+
+def _value_counts(values):
+    """Counts per value, largest first, with missing values as 'Unknown'."""
+    counts = values.astype(object).fillna('Unknown').value_counts()
+    return {str(value): int(count) for value, count in counts.items()}
+
+
+def _gap_masks(gap_matrix):
+    """Gap bitmask of every row of a gap matrix (bit i is its column i)."""
+    return (gap_matrix.to_numpy() @ (1 << np.arange(gap_matrix.shape[1]))).astype(np.uint32)
+
+
+def _gap_labels(mask, gap_types=CARE_GAP_TYPES):
+    """Report labels of the gap types set in a gap bitmask, in gap_types order."""
+    return [label for i, (_, label, _) in enumerate(gap_types) if mask >> i & 1]
+
+
+def _issue_label(table, issue):
+    """Report label for a data quality rule; patient rules keep their plain wording."""
+    return issue if table == 'patients' else f"{issue} ({table.replace('_', ' ')})"
+
+
+def _sum_validation(validation):
+    """Sum the (counts, issues) results of validating several chunks of one table."""
+    counts = {}
+    for chunk_counts, _ in validation:
+        for label, count in chunk_counts.items():
+            counts[label] = counts.get(label, 0) + count
+    issues = [chunk_issues for _, chunk_issues in validation]
+    if not issues:
+        issues = [pd.DataFrame(columns=['table', 'row', 'patient_id', 'issue_mask'])]
+    return counts, pd.concat(issues, ignore_index=True)
+
+
+def _partition_by_patient(df, workers):
+    """
+    Hash-partition a table by patient_id (column or index) into `workers` parts.
+    """
+    if df is None:
+        return [None] * workers
+    patient_ids = df['patient_id'] if 'patient_id' in df.columns else df.index.to_series()
+    hashes = pd.util.hash_pandas_object(patient_ids.astype(object), index=False).to_numpy()
+    shard = hashes % workers
+    return [df[shard == i] for i in range(workers)]
+
+
+def _run_shard(tables, as_of=None, gap_rules=None):
+    """
+    Process-pool worker: clean, validate and identify care gaps for one shard.
+    """
+    processor = HealthcareDataProcessor(gap_rules)
+    for name, df in tables.items():
+        setattr(processor, name, df)
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        original_count = len(processor.patients_df)
+        processor.clean_data()
+        processor.validate_data_quality()
+        processor.identify_care_gaps(as_of)
+    
+    return {
+        'care_gaps': processor.care_gaps,
+        'patients_df': processor.patients_df,
+        'screening_df': processor.screening_df,
+        'visits_df': processor.visits_df,
+        'lab_results_df': processor.lab_results_df,
+        'lab_timeline': processor.lab_timeline,
+        'visit_index': processor.visit_index,
+        'lab_index': processor.lab_index,
+        'duplicates_removed': original_count - len(processor.patients_df),
+        'data_quality_counts': processor.data_quality_counts,
+        'validation_issues': processor.validation_issues,
+        'gaps_evaluated_at': processor.gaps_evaluated_at,
+    }
+
+
+def _cpu_seconds():
+    """User + system CPU time of this process and its finished children."""
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return round(peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def _file_sha256(path, block_size=1 << 20):
+    """
+    Content hash of a file, read in blocks so large extracts are not held in memory.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _latest_lab_results(lab_results):
+    """
+    Latest lab result per patient and test type, ties going to the later row.
+    """
+    ordered = lab_results.sort_values('test_date', na_position='first', kind='stable')
+    latest = ordered.drop_duplicates(subset=['patient_id', 'test_type'], keep='last')
+    return latest.sort_values(['patient_id', 'test_type'], kind='stable').reset_index(drop=True)
+
+
+def _linkage_codes(patients):
+    """
+    Normalized linkage fields of each patient as integer codes, -1 when missing:
+    phone (last 10 digits, at least 7), email, first and last name (letters
+    only), first initial, the name blocking key, and address (alphanumerics,
+    street-type words dropped). Age and gender are kept for conflict checks,
+    and the normalized first names for the compatibility check of differing ones.
+    """
+    def codes(values):
+        return pd.factorize(values.where(values.notna() & (values != '')))[0]
+    
+    def letters(names):
+        return names.astype(str).str.lower().str.replace(r'[^a-z]', '', regex=True).where(names.notna())
+    
+    phones = _phone_digits(patients['phone']).str[-10:]
+    emails = patients['email'].astype(str).str.strip().str.lower()
+    first_names, last_names = letters(patients['first_name']), letters(patients['last_name'])
+    addresses = (patients['address'].astype(str).str.lower()
+                 .str.replace(STREET_TYPE_PATTERN, '', regex=True).str.replace(r'[^a-z0-9]', '', regex=True))
+    genders = patients['gender'].astype(str).str.upper()
+    return {
+        'phone': codes(phones.where(patients['phone'].notna() & (phones.str.len() >= 7))),
+        'email': codes(emails.where(validate_emails(patients['email']))),
+        'first': codes(first_names),
+        'first_name': first_names.to_numpy(dtype=object),
+        'last': codes(last_names),
+        'initial': codes(first_names.str[:1]),
+        'name': codes(last_names + ' ' + first_names.str[:1]),
+        'address': codes(addresses.where(patients['address'].notna())),
+        'age': pd.to_numeric(patients['age'], errors='coerce').astype('float64').to_numpy(),
+        'gender': codes(genders.where(genders.isin(['M', 'F']))),
+    }
+
+
+def _link_records(codes, window=LINKAGE_WINDOW):
+    """
+    Position of each record's canonical record (the first of its linked group),
+    comparing sorted neighbours within each blocking key as described in
+    HealthcareDataProcessor.link_patient_records.
+    """
+    n = len(codes['age'])
+    matched_a, matched_b = [], []
+    for key in LINKAGE_BLOCKING_KEYS:
+        block = codes[key]
+        keyed = np.flatnonzero(block >= 0)
+        # Within a block, likely duplicates (same address, same first name) sort next to each other
+        order = keyed[np.lexsort((codes['first'][keyed], codes['address'][keyed], block[keyed]))]
+        for offset in range(1, window + 1):
+            a, b = order[:-offset], order[offset:]
+            same_block = block[a] == block[b]
+            a, b = a[same_block], b[same_block]
+            match = _records_match(codes, a, b)
+            matched_a.append(a[match])
+            matched_b.append(b[match])
+    
+    a, b = np.concatenate(matched_a), np.concatenate(matched_b)
+    # Connected components by minimum-label propagation; each label ends up as
+    # the smallest position in its group
+    labels = np.arange(n)
+    while len(a) and (labels[a] != labels[b]).any():
+        low = np.minimum(labels[a], labels[b])
+        np.minimum.at(labels, a, low)
+        np.minimum.at(labels, b, low)
+        labels = labels[labels]
+    return labels
+
+
+def _records_match(codes, a, b):
+    """Match decision for candidate pairs (a[i], b[i]) of record positions."""
+    def agree(field):
+        values = codes[field]
+        return (values[a] == values[b]) & (values[a] >= 0)
+    
+    email = agree('email')
+    evidence = agree('phone').astype(np.int8) + email + agree('address')
+    age_conflict = np.abs(codes['age'][a] - codes['age'][b]) > 1
+    gender = codes['gender']
+    gender_conflict = (gender[a] >= 0) & (gender[b] >= 0) & (gender[a] != gender[b])
+    match = (agree('last') & agree('initial') & ~age_conflict & ~gender_conflict
+             & ((evidence >= 2) | (email & agree('first'))))
+    
+    # Differing first names only match when one is a prefix of the other; the
+    # few remaining candidate pairs are compared as strings
+    first = codes['first']
+    differ = np.flatnonzero(match & (first[a] >= 0) & (first[b] >= 0) & (first[a] != first[b]))
+    names = codes['first_name']
+    match[differ] = [x.startswith(y) or y.startswith(x) for x, y in zip(names[a[differ]], names[b[differ]])]
+    return match
+
+
+def _canonical_ids(patient_ids, patient_id_map):
+    """patient_ids as an object array, with linked duplicates replaced by their canonical id."""
+    positions = patient_id_map.index.get_indexer(patient_ids)
+    linked = positions >= 0
+    canonical = np.asarray(patient_ids, dtype=object).copy()
+    canonical[linked] = patient_id_map.to_numpy()[positions[linked]]
+    return canonical
+
+
+def _remap_patient_ids(df, patient_id_map):
+    """df with linked duplicate patient_ids replaced by their canonical id."""
+    if not len(patient_id_map):
+        return df
+    patient_ids = df['patient_id']
+    if isinstance(patient_ids.dtype, pd.CategoricalDtype):
+        # Remap the categories, then the codes, without touching each row's string
+        category_codes, categories = pd.factorize(_canonical_ids(patient_ids.cat.categories, patient_id_map))
+        codes = patient_ids.cat.codes.to_numpy()
+        remapped = pd.Categorical.from_codes(np.where(codes >= 0, category_codes[codes], -1),
+                                             categories=pd.Index(categories).astype(patient_ids.cat.categories.dtype))
+    else:
+        remapped = pd.array(_canonical_ids(patient_ids.to_numpy(), patient_id_map), dtype=patient_ids.dtype)
+    return df.assign(patient_id=remapped)
+
+
+def _write_patient_id_map(patient_id_map, path):
+    """Write a patient_id_map as a Feather table of patient_id, canonical_patient_id."""
+    df = pd.DataFrame({'patient_id': patient_id_map.index.astype(str),
+                       'canonical_patient_id': patient_id_map.astype(str).to_numpy()})
+    feather.write_feather(df, path, compression='uncompressed')
+
+
+def _read_patient_id_map(path):
+    """patient_id_map written by _write_patient_id_map; empty when there is none."""
+    if not os.path.exists(path):
+        return pd.Series(dtype=object)
+    df = feather.read_table(path).to_pandas()
+    return pd.Series(df['canonical_patient_id'].to_numpy(dtype=object),
+                     index=pd.Index(df['patient_id'].to_numpy(dtype=object)), name='canonical_patient_id')
+
+
+def _merge_linked_screenings(screenings, patient_ids):
+    """
+    One screening row for each of patient_ids: its first row, with every due
+    date replaced by the latest due date among the patient's rows.
+    """
+    linked = screenings['patient_id'].isin(patient_ids)
+    rows = screenings[linked]
+    if not rows['patient_id'].duplicated().any():
+        return screenings
+    
+    merged = rows.drop_duplicates(subset=['patient_id'])
+    for col in [col for col in rows.columns if col.endswith('_due')]:
+        dates = pd.to_datetime(rows[col], errors='coerce')
+        latest = (rows.assign(_date=dates).sort_values('_date', na_position='first', kind='stable')
+                  .drop_duplicates(subset=['patient_id'], keep='last').set_index('patient_id')[col])
+        merged = merged.assign(**{col: latest.reindex(merged['patient_id']).to_numpy()})
+    return pd.concat([screenings[~linked], merged]).sort_index()
+
+
 def calculate_days_between_dates(date1, date2):
     """
     Calculate the number of days between two dates.
@@ -552,6 +3037,28 @@ def validate_email(email):
     return '@' in str(email) and '.' in str(email)
 
 
+def normalize_phone_numbers(phones):
+    """
+    Vectorized format_phone_number for a whole Series.
+    """
+    digits = _phone_digits(phones)
+    formatted = '(' + digits.str[:3] + ') ' + digits.str[3:6] + '-' + digits.str[6:]
+    return formatted.where(digits.str.len() == 10, phones).where(phones.notna(), None)
+
+
+def _phone_digits(phones):
+    """Digits of each phone number, with all formatting characters removed."""
+    return phones.astype(str).str.replace(r'\D', '', regex=True)
+
+
+def validate_emails(emails):
+    """
+    Vectorized validate_email for a whole Series.
+    """
+    text = emails.astype(str)
+    return emails.notna() & text.str.contains('@', regex=False) & text.str.contains('.', regex=False)
+
+
 # Run the program
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import os
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..'))
+from healthcare_pipeline import HealthcareDataProcessor, SOURCE_FILES
+from dirty_data import AS_OF, write_dirty_dataset
+
+
+@pytest.fixture(scope='session')
+def dirty_data_dir(tmp_path_factory):
+    """The dirty source extracts of dirty_data.py, written once per session."""
+    data_dir = tmp_path_factory.mktemp('dirty_data')
+    write_dirty_dataset(data_dir)
+    return data_dir
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    """
+    Factory for run directories: run_dir(name, source_dir) copies the source
+    CSVs into tmp_path/name and makes it the working directory, since the
+    pipeline reads and writes there.
+    """
+    def make(name, source_dir):
+        path = tmp_path / name
+        path.mkdir()
+        for file_name in SOURCE_FILES:
+            shutil.copy(os.path.join(source_dir, file_name), path / file_name)
+        monkeypatch.chdir(path)
+        return path
+    return make
+
+
+@pytest.fixture
+def run_pipeline(run_dir, dirty_data_dir):
+    """
+    Factory: run_pipeline(name, **kwargs) runs run_full_analysis as of AS_OF
+    on the dirty data in its own directory and returns the processor.
+    """
+    def run(name, source_dir=dirty_data_dir, processor=None, **kwargs):
+        run_dir(name, source_dir)
+        processor = processor or HealthcareDataProcessor()
+        kwargs.setdefault('as_of', AS_OF)
+        processor.run_full_analysis(charts='skip', **kwargs)
+        return processor
+    return run
+
+
+def gap_table(processor, care_gaps=None):
+    """Care gap records of a processor as a frame, comparable with assert_frame_equal."""
+    care_gaps = processor.care_gaps if care_gaps is None else care_gaps
+    records = pd.DataFrame(care_gaps.records(processor.patients_df),
+                           columns=['patient_id', 'name', 'age', 'gender', 'phone', 'email', 'gaps', 'priority'])
+    return records.assign(gaps=records['gaps'].map('; '.join)).astype(object)
+
+
+def report_text(path='summary_statistics.txt'):
+    """The summary report without its Generated: timestamp line."""
+    with open(path) as f:
+        return [line for line in f if not line.startswith('Generated:')]
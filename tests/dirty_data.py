@@ -0,0 +1,150 @@
+"""
+Small, deterministic, deliberately dirty source extracts for the test suite.
+
+Besides clean rows, the extracts have unparseable and missing dates, missing
+and invalid ages, genders in mixed case or missing, exact duplicate patient
+rows, missing and duplicate screening rows, visits and lab results for
+unknown patient_ids, and LINKED_DUPLICATES: patients filed a second time
+under another patient_id with reformatted contact details.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# Evaluation date the tests pin every run to; visits and lab results are dated before it
+AS_OF = '2025-06-01'
+
+FIRST_NAMES = ['Ana', 'Ben', 'Cara', 'Dev', 'Eli', 'Fay', 'Gus', 'Hana', 'Ivo', 'Jo',
+               'Kai', 'Lea', 'Max', 'Nia', 'Oto', 'Pia', 'Quin', 'Ria', 'Sam', 'Tea']
+LAST_NAMES = ['Abbot', 'Baker', 'Chen', 'Diaz', 'Evans', 'Fox', 'Garcia', 'Hill', 'Ito', 'Jones',
+              'Khan', 'Lopez', 'Moore', 'Nowak', 'Olsen', 'Patel', 'Quinn', 'Reyes', 'Silva', 'Tran']
+DIAGNOSES = ['Type 2 Diabetes', 'Hypertension', 'Asthma', 'type 1 diabetes', None]
+
+# Duplicate patient_id -> the patient_id it is a second record of
+LINKED_DUPLICATES = {f'D{i:04d}': f'P{i * 37:04d}' for i in range(8)}
+
+SCREENING_COLUMNS = ['mammogram_due', 'colonoscopy_due', 'flu_shot_due', 'blood_pressure_check_due',
+                     'cholesterol_check_due', 'diabetic_eye_exam_due']
+
+
+def random_dates(rng, count, start, end, bad_share=0.02, missing_share=0.05):
+    """ISO dates between start and end, with some unparseable and some missing."""
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days
+    dates = (pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, count), unit='D')).strftime('%Y-%m-%d')
+    dates = np.array(dates, dtype=object)
+    roll = rng.random(count)
+    dates[roll < bad_share] = 'garbage'
+    dates[(roll >= bad_share) & (roll < bad_share + missing_share)] = None
+    return dates
+
+
+def make_patients(rng, n_patients):
+    ids = np.array([f'P{i:04d}' for i in range(n_patients)], dtype=object)
+    first = np.array(FIRST_NAMES, dtype=object)[rng.integers(0, len(FIRST_NAMES), n_patients)]
+    last = np.array(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), n_patients)]
+    ages = rng.integers(0, 95, n_patients).astype(object)
+    roll = rng.random(n_patients)
+    ages[roll < 0.03] = None
+    ages[(roll >= 0.03) & (roll < 0.04)] = -3
+    ages[(roll >= 0.04) & (roll < 0.05)] = 130
+    genders = np.array(['F', 'M', 'f', 'm', 'X', None], dtype=object)[rng.integers(0, 6, n_patients)]
+    phones = np.array([f'(555) {i // 10000:03d}-{i % 10000:04d}' for i in range(1000, 1000 + n_patients)],
+                      dtype=object)
+    phones[rng.random(n_patients) < 0.05] = None
+    emails = np.array([f'{f.lower()}.{l.lower()}{i}@example.com' for i, (f, l) in enumerate(zip(first, last))],
+                      dtype=object)
+    roll = rng.random(n_patients)
+    emails[roll < 0.05] = None
+    emails[(roll >= 0.05) & (roll < 0.08)] = 'not-an-email'
+    return pd.DataFrame({
+        'patient_id': ids,
+        'first_name': first,
+        'last_name': last,
+        'age': ages,
+        'gender': genders,
+        'primary_diagnosis': np.array(DIAGNOSES, dtype=object)[rng.integers(0, len(DIAGNOSES), n_patients)],
+        'phone': phones,
+        'email': emails,
+        'address': [f'{i} Oak Street' for i in range(n_patients)],
+    })
+
+
+def linked_duplicate_rows(patients):
+    """Second records of LINKED_DUPLICATES patients: same person, reformatted contact details."""
+    linked = patients['patient_id'].isin(list(LINKED_DUPLICATES.values()))
+    digits = patients.index[linked] + 1000
+    patients.loc[linked, 'phone'] = [f'(555) {i // 10000:03d}-{i % 10000:04d}' for i in digits]
+    patients.loc[linked, 'email'] = (patients.loc[linked, 'first_name'].str.lower() + '@example.com').to_numpy()
+    originals = patients.set_index('patient_id').loc[list(LINKED_DUPLICATES.values())].reset_index()
+    return originals.assign(
+        patient_id=list(LINKED_DUPLICATES),
+        phone=[f'555.{i // 10000:03d}.{i % 10000:04d}' for i in digits],
+        email=originals['email'].str.upper(),
+        address=originals['address'].str.replace('Street', 'St'),
+        gender=originals['gender'].str.lower(),
+    )
+
+
+def make_screenings(rng, patient_ids):
+    kept = patient_ids[rng.random(len(patient_ids)) >= 0.08]
+    repeated = kept[rng.random(len(kept)) < 0.03]
+    ids = np.concatenate([kept, repeated])
+    screenings = pd.DataFrame({'patient_id': ids})
+    for col in SCREENING_COLUMNS:
+        screenings[col] = random_dates(rng, len(ids), '2023-01-01', '2027-12-31', missing_share=0.08)
+    return screenings
+
+
+def make_events(rng, patient_ids, count, date_column, start, end):
+    """Visit or lab result rows for random patients, a few for unknown patient_ids."""
+    ids = np.array(patient_ids, dtype=object)[rng.integers(0, len(patient_ids), count)]
+    ids[rng.random(count) < 0.02] = 'X9999'
+    ids[rng.random(count) < 0.01] = None
+    return pd.DataFrame({'patient_id': ids, date_column: random_dates(rng, count, start, end)})
+
+
+def make_visits(rng, patient_ids, count, start='2023-01-01', end='2025-03-31'):
+    visits = make_events(rng, patient_ids, count, 'visit_date', start, end)
+    visits['visit_type'] = np.array(['Annual Physical', 'Follow-up', 'Sick Visit'], dtype=object)[
+        rng.integers(0, 3, count)]
+    visits['provider'] = 'Dr. Who'
+    visits['notes'] = 'note'
+    visits['next_appointment'] = random_dates(rng, count, '2023-06-01', '2026-06-30')
+    return visits
+
+
+def make_lab_results(rng, patient_ids, count, start='2023-01-01', end='2025-03-31'):
+    labs = make_events(rng, patient_ids, count, 'test_date', start, end)
+    labs['test_type'] = np.array(['HbA1c', 'Glucose', 'Cholesterol'], dtype=object)[rng.integers(0, 3, count)]
+    values = np.round(rng.uniform(4, 140, count), 1).astype(object)
+    values[labs['test_type'].to_numpy() == 'HbA1c'] = np.round(rng.uniform(4, 11, count), 1)[
+        labs['test_type'].to_numpy() == 'HbA1c']
+    values[rng.random(count) < 0.03] = None
+    labs['result_value'] = values
+    labs['reference_range'] = 'n/a'
+    labs['status'] = np.array(['High', 'Normal', 'Low', 'Critical', None], dtype=object)[rng.integers(0, 5, count)]
+    labs['provider_notes'] = 'n'
+    return labs
+
+
+def write_dirty_dataset(data_dir, n_patients=500, seed=0):
+    """Write patients.csv, visits.csv, screenings.csv and lab_results.csv into data_dir."""
+    rng = np.random.default_rng(seed)
+    patients = make_patients(rng, n_patients)
+    duplicates = linked_duplicate_rows(patients)
+    exact_repeats = patients.sample(10, random_state=seed)
+    patients = pd.concat([patients, exact_repeats, duplicates], ignore_index=True)
+
+    patient_ids = patients['patient_id'].drop_duplicates().to_numpy()
+    tables = {
+        'patients.csv': patients,
+        'screenings.csv': make_screenings(rng, patient_ids),
+        'visits.csv': make_visits(rng, patient_ids, 5 * n_patients),
+        'lab_results.csv': make_lab_results(rng, patient_ids, 5 * n_patients),
+    }
+    os.makedirs(data_dir, exist_ok=True)
+    for name, df in tables.items():
+        df.to_csv(os.path.join(data_dir, name), index=False)
+    return tables
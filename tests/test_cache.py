@@ -0,0 +1,28 @@
+"""
+The cleaned-data cache key: source file contents and the pipeline code.
+"""
+
+import shutil
+
+import healthcare_pipeline
+from healthcare_pipeline import CleanedDataCache, SOURCE_FILES
+
+
+def test_cache_key_changes_with_sources_and_code(run_dir, dirty_data_dir, tmp_path, monkeypatch):
+    run_dir('cache', dirty_data_dir)
+    cache = CleanedDataCache('cache')
+    key = cache.fingerprint()
+    assert key is not None and cache.fingerprint() == key
+
+    with open(SOURCE_FILES[0], 'a') as f:
+        f.write('\n')
+    source_key = cache.fingerprint()
+    assert source_key != key
+
+    # Another version of the pipeline module must not read this version's entries
+    changed_code = tmp_path / 'healthcare_pipeline.py'
+    shutil.copy(healthcare_pipeline.__file__, changed_code)
+    with open(changed_code, 'a') as f:
+        f.write('\n# changed\n')
+    monkeypatch.setattr(healthcare_pipeline, '__file__', str(changed_code))
+    assert cache.fingerprint() != source_key
@@ -0,0 +1,28 @@
+"""
+Standardization of patient contact details by clean_data.
+"""
+
+import shutil
+
+import pandas as pd
+
+from healthcare_pipeline import format_phone_number, normalize_phone_numbers
+
+
+def test_normalize_phone_numbers_matches_format_phone_number():
+    phones = pd.Series(['555.000.0003', '(555) 000-0001', '555 000 0002', '555-0101', '12345', None])
+    expected = pd.Series([format_phone_number(phone) for phone in phones], dtype=phones.dtype)
+    pd.testing.assert_series_equal(normalize_phone_numbers(phones), expected)
+
+
+def test_clean_data_formats_phone_numbers(run_pipeline, dirty_data_dir, tmp_path):
+    source = tmp_path / 'source'
+    shutil.copytree(dirty_data_dir, source)
+    patients = pd.read_csv(source / 'patients.csv', dtype=str)
+    patients['phone'] = patients['phone'].str.replace(r'\D', '', regex=True)
+    patients.to_csv(source / 'patients.csv', index=False)
+
+    processor = run_pipeline('phones', source_dir=source)
+    phones = processor.patients_df['phone']
+    assert phones.notna().any()
+    assert phones.dropna().str.fullmatch(r'\(\d{3}\) \d{3}-\d{4}').all()
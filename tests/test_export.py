@@ -0,0 +1,21 @@
+"""
+Partitioned exports of the care gaps report.
+"""
+
+import os
+
+from healthcare_pipeline import export_care_gaps
+
+
+def test_partitioned_export_replaces_earlier_partitions(run_pipeline):
+    processor = run_pipeline('export')
+    stale = os.path.join('partitioned', 'priority=Urgent.csv')
+    os.makedirs('partitioned')
+    with open(stale, 'w') as f:
+        f.write('left over from an earlier export\n')
+
+    paths = export_care_gaps(processor.care_gaps, processor.patients_df, 'partitioned', partition_by='priority')
+    assert not os.path.exists(stale)
+    assert sorted(os.listdir('partitioned')) == sorted(os.path.basename(path) for path in paths)
+    assert all(os.path.exists(path) for path in paths)
+    assert not os.path.exists('partitioned.tmp')
@@ -0,0 +1,75 @@
+"""
+Record linkage: which records are merged, and that the ids of merged
+duplicates keep resolving to their canonical patient downstream.
+"""
+
+import pandas as pd
+
+from dirty_data import AS_OF, LINKED_DUPLICATES, SCREENING_COLUMNS
+from healthcare_pipeline import CareGapService, HealthcareDataProcessor
+
+
+def write_family(data_dir):
+    """
+    Twins Mark and Mike Smith (same age, gender, phone and address; only Mark's
+    flu shot is overdue) and Jonathan Reed, filed again as Jon Reed with his
+    phone and address reformatted.
+    """
+    data_dir.mkdir()
+    pd.DataFrame({
+        'patient_id': ['T0001', 'T0002', 'T0003', 'T0004'],
+        'first_name': ['Mark', 'Mike', 'Jonathan', 'Jon'],
+        'last_name': ['Smith', 'Smith', 'Reed', 'Reed'],
+        'age': [40, 40, 50, 51],
+        'gender': ['M', 'M', 'M', 'm'],
+        'primary_diagnosis': ['Hypertension'] * 4,
+        'phone': ['(555) 000-0001', '(555) 000-0001', '(555) 000-0003', '555.000.0003'],
+        'email': ['mark@example.com', 'mike@example.com', 'jreed@example.com', None],
+        'address': ['1 Elm Street', '1 Elm Street', '3 Oak Avenue', '3 Oak Ave'],
+    }).to_csv(data_dir / 'patients.csv', index=False)
+    screenings = pd.DataFrame({'patient_id': ['T0001', 'T0002', 'T0003', 'T0004']})
+    for col in SCREENING_COLUMNS:
+        screenings[col] = '2030-01-01'
+    screenings.loc[0, 'flu_shot_due'] = '2025-01-01'
+    screenings.to_csv(data_dir / 'screenings.csv', index=False)
+    pd.DataFrame({'patient_id': ['T0001'], 'visit_date': ['2025-03-01'], 'visit_type': ['Annual Physical'],
+                  'provider': ['Dr. Who'], 'notes': ['note'], 'next_appointment': ['2026-03-01']}
+                 ).to_csv(data_dir / 'visits.csv', index=False)
+    pd.DataFrame({'patient_id': ['T0001'], 'test_date': ['2025-03-01'], 'test_type': ['Cholesterol'],
+                  'result_value': [150], 'reference_range': ['n/a'], 'status': ['Normal'],
+                  'provider_notes': ['n']}).to_csv(data_dir / 'lab_results.csv', index=False)
+
+
+def test_links_shortened_first_name_but_not_siblings(run_pipeline, tmp_path):
+    write_family(tmp_path / 'family')
+    processor = run_pipeline('linked', source_dir=tmp_path / 'family')
+    assert dict(processor.patient_id_map) == {'T0004': 'T0003'}
+
+    gaps = {record['patient_id']: record['gaps'] for record in processor.care_gaps.records(processor.patients_df)}
+    assert 'Flu shot needed' in gaps['T0001']
+    assert 'Flu shot needed' not in gaps.get('T0002', [])
+
+
+def test_cache_hit_restores_patient_id_map(run_pipeline):
+    run_pipeline('cache_miss', use_cache=True)
+    processor = HealthcareDataProcessor()
+    processor.run_full_analysis(charts='skip', as_of=AS_OF, use_cache=True, state_path='state.pkl')
+    assert dict(processor.patient_id_map) == LINKED_DUPLICATES
+    assert dict(pd.read_pickle('state.pkl')['patient_id_map']) == LINKED_DUPLICATES
+
+
+def test_evaluate_patients_resolves_linked_duplicates(run_pipeline):
+    processor = run_pipeline('store', patient_store_dir='patient_store')
+    for duplicate, canonical in LINKED_DUPLICATES.items():
+        assert (processor.evaluate_patients(duplicate, as_of=AS_OF)
+                == processor.evaluate_patients(canonical, as_of=AS_OF))
+    records = processor.evaluate_patients(list(LINKED_DUPLICATES) + list(LINKED_DUPLICATES.values()), as_of=AS_OF)
+    assert sorted(record['patient_id'] for record in records) == sorted(LINKED_DUPLICATES.values())
+
+
+def test_service_query_resolves_linked_duplicates(dirty_data_dir):
+    service = CareGapService(data_dir=str(dirty_data_dir))
+    for duplicate, canonical in LINKED_DUPLICATES.items():
+        answer = service.query(duplicate)
+        assert answer is not None and answer == service.query(canonical)
+    assert service.query('no-such-patient') is None
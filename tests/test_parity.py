@@ -0,0 +1,257 @@
+"""
+Every execution mode against the serial path, on the dirty extracts and
+pinned to AS_OF: the care gaps, the summary report, the exported report and
+the data quality counts have to match exactly.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import gap_table, report_text
+from dirty_data import AS_OF, LINKED_DUPLICATES, make_lab_results, make_visits, write_dirty_dataset
+from healthcare_pipeline import HealthcareDataProcessor
+
+
+def outputs(processor):
+    """What a run produced, read from its working directory."""
+    with open('care_gaps_report.csv', 'rb') as f:
+        report_csv = f.read()
+    return {
+        'care_gaps': gap_table(processor),
+        'report': report_text(),
+        'report_csv': report_csv,
+        'data_quality_counts': processor.data_quality_counts,
+    }
+
+
+def assert_same_outputs(actual, expected):
+    pd.testing.assert_frame_equal(actual['care_gaps'], expected['care_gaps'])
+    assert actual['report'] == expected['report']
+    assert actual['report_csv'] == expected['report_csv']
+    assert actual['data_quality_counts'] == expected['data_quality_counts']
+
+
+@pytest.fixture
+def serial(run_pipeline):
+    processor = run_pipeline('serial')
+    return processor, outputs(processor)
+
+
+def test_serial_run_links_duplicates_and_finds_gaps(serial):
+    processor, result = serial
+    assert dict(processor.patient_id_map) == LINKED_DUPLICATES
+    assert not processor.patients_df['patient_id'].duplicated().any()
+    assert len(result['care_gaps']) > 0
+
+
+def test_streaming_matches_serial(run_pipeline, serial):
+    # The smallest memory limit reads the 2,500-row extracts in several chunks
+    processor = run_pipeline('streaming', streaming=True, memory_limit_mb=0.001)
+    assert_same_outputs(outputs(processor), serial[1])
+
+
+def test_streaming_rejects_as_of_before_latest_records(run_pipeline):
+    # Streamed runs only keep each patient's latest visit and lab results
+    with pytest.raises(ValueError, match='as of 2023-01-01'):
+        run_pipeline('streaming', streaming=True, as_of='2023-01-01')
+
+
+def test_sharded_matches_serial(run_pipeline, serial):
+    processor = run_pipeline('sharded', workers=2)
+    assert_same_outputs(outputs(processor), serial[1])
+
+
+def test_sharded_run_then_as_of_evaluation_matches_serial(run_pipeline, serial):
+    # The sharded run leaves cleaned visits and lab results behind for later evaluations
+    processor = run_pipeline('sharded', workers=2)
+    expected = serial[0]
+    pd.testing.assert_frame_equal(processor.lab_timeline, expected.lab_timeline)
+    pd.testing.assert_frame_equal(processor.visits_df, expected.visits_df)
+    for index in ['visit_index', 'lab_index']:
+        pd.testing.assert_frame_equal(getattr(processor, index).sort_index(), getattr(expected, index).sort_index())
+
+    dates = ['2024-01-01', AS_OF]
+    cube, expected_cube = processor.backtest_care_gaps(dates), expected.backtest_care_gaps(dates)
+    for as_of in dates:
+        pd.testing.assert_frame_equal(gap_table(processor, cube.store(as_of)),
+                                      gap_table(expected, expected_cube.store(as_of)))
+        processor.identify_care_gaps(as_of)
+        expected.identify_care_gaps(as_of)
+        pd.testing.assert_frame_equal(gap_table(processor), gap_table(expected))
+
+
+def test_resume_from_sharded_checkpoint_matches_serial(run_pipeline, serial):
+    # clean_data is checkpointed by a sharded run and restored by a serial one as of another date
+    run_pipeline('checkpointed', workers=2, checkpoint_dir='checkpoints')
+    processor = HealthcareDataProcessor()
+    processor.run_full_analysis(charts='skip', as_of='2024-09-15', checkpoint_dir='checkpoints')
+    expected = serial[0]
+    expected.identify_care_gaps('2024-09-15')
+    pd.testing.assert_frame_equal(gap_table(processor), gap_table(expected))
+    assert processor.data_quality_counts == expected.data_quality_counts
+
+
+def test_cached_run_matches_serial(run_pipeline, serial):
+    run_pipeline('cache_miss', use_cache=True)
+    processor = HealthcareDataProcessor()
+    processor.run_full_analysis(charts='skip', as_of=AS_OF, use_cache=True)
+    assert_same_outputs(outputs(processor), serial[1])
+
+
+def test_backtest_matches_identify_care_gaps(serial):
+    processor = serial[0]
+    dates = ['2023-06-01', '2024-01-01', '2024-09-15', AS_OF]
+    cube = processor.backtest_care_gaps(dates)
+    for as_of in dates:
+        processor.identify_care_gaps(as_of)
+        pd.testing.assert_frame_equal(gap_table(processor, cube.store(as_of)), gap_table(processor))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_patient_store_matches_identify_care_gaps(run_pipeline, workers):
+    processor = run_pipeline('store', patient_store_dir='patient_store', workers=workers)
+    expected = gap_table(processor).set_index('patient_id')
+    patient_ids = processor.patients_df['patient_id'].dropna().sample(50, random_state=0).tolist()
+
+    records = processor.evaluate_patients(patient_ids, store_dir='patient_store', as_of=AS_OF)
+    assert sorted(record['patient_id'] for record in records) == sorted(patient_ids)
+    for record in records:
+        if record['gaps']:
+            assert '; '.join(record['gaps']) == expected.loc[record['patient_id'], 'gaps']
+            assert record['priority'] == expected.loc[record['patient_id'], 'priority']
+        else:
+            assert record['patient_id'] not in expected.index
+
+
+def test_patient_store_needs_cleaned_tables(run_dir, dirty_data_dir):
+    run_dir('uncleaned', dirty_data_dir)
+    processor = HealthcareDataProcessor()
+    processor.load_data()
+    with pytest.raises(ValueError, match='clean_data'):
+        processor.save_patient_store()
+
+
+def write_deltas(data_dir, tables, rng):
+    """
+    Delta files for apply_deltas (changed and new patients, changed screenings,
+    visits and lab results after the first evaluation) and the full extracts
+    they add up to.
+    """
+    patients, screenings, visits = tables['patients.csv'], tables['screenings.csv'], tables['visits.csv']
+    unlinked = patients[~patients['patient_id'].isin(list(LINKED_DUPLICATES) + list(LINKED_DUPLICATES.values()))]
+    changed = unlinked.drop_duplicates('patient_id').sample(20, random_state=1).assign(age=70, gender='f')
+    new = unlinked.head(10).assign(
+        patient_id=[f'N{i:04d}' for i in range(10)], first_name=[f'New{i}' for i in range(10)],
+        phone=[f'(555) 900-{i:04d}' for i in range(10)], email=[f'new{i}@example.com' for i in range(10)],
+        address=[f'{i} New Road' for i in range(10)])
+    delta_patients = pd.concat([changed, new])
+    delta_screenings = screenings.drop_duplicates('patient_id').sample(20, random_state=2).assign(
+        flu_shot_due='2030-01-01')
+    delta_visits = make_visits(rng, unlinked['patient_id'].unique(), 100, start='2025-04-02', end='2025-09-30')
+    delta_labs = make_lab_results(rng, unlinked['patient_id'].unique(), 200, start='2025-04-02', end='2025-09-30')
+
+    full = {
+        'patients.csv': pd.concat([patients[~patients['patient_id'].isin(delta_patients['patient_id'])],
+                                   delta_patients]),
+        'screenings.csv': pd.concat([screenings[~screenings['patient_id'].isin(delta_screenings['patient_id'])],
+                                     delta_screenings]),
+        'visits.csv': pd.concat([visits, delta_visits]),
+        'lab_results.csv': pd.concat([tables['lab_results.csv'], delta_labs]),
+    }
+    os.makedirs(os.path.join(data_dir, 'full'))
+    for name, df in full.items():
+        df.to_csv(os.path.join(data_dir, 'full', name), index=False)
+    for name, df in [('delta_patients.csv', delta_patients), ('delta_screenings.csv', delta_screenings),
+                     ('delta_visits.csv', delta_visits), ('delta_lab_results.csv', delta_labs)]:
+        df.to_csv(os.path.join(data_dir, name), index=False)
+
+
+def zero_pad_patient_ids(data_dir):
+    """
+    Rewrite every CSV in data_dir (and data_dir/full) with numeric, zero-padded
+    patient_ids (P0037 -> 00037, D0001 -> 10001, ...), which type inference
+    would read as integers.
+    """
+    digits = {'P': '0', 'D': '1', 'N': '2', 'X': '9'}
+    for directory in [data_dir, data_dir / 'full']:
+        for path in directory.glob('*.csv'):
+            df = pd.read_csv(path, dtype=str)
+            df['patient_id'] = df['patient_id'].str[0].map(digits) + df['patient_id'].str[1:]
+            df.to_csv(path, index=False)
+
+
+@pytest.mark.parametrize('zero_padded', [False, True])
+def test_incremental_update_matches_full_run(tmp_path, run_pipeline, zero_padded):
+    base_dir = tmp_path / 'source'
+    tables = write_dirty_dataset(base_dir)
+    write_deltas(base_dir, tables, np.random.default_rng(1))
+    if zero_padded:
+        zero_pad_patient_ids(base_dir)
+    state_path = str(tmp_path / 'state.pkl')
+    base = run_pipeline('base', source_dir=base_dir, as_of='2025-04-01', state_path=state_path)
+
+    incremental = HealthcareDataProcessor()
+    incremental.load_gap_state(state_path)
+    incremental.apply_deltas(str(base_dir / 'delta_patients.csv'), str(base_dir / 'delta_visits.csv'),
+                             str(base_dir / 'delta_screenings.csv'), str(base_dir / 'delta_lab_results.csv'),
+                             as_of='2025-10-01')
+    full = run_pipeline('full', source_dir=base_dir / 'full', as_of='2025-10-01')
+
+    def by_patient(processor):
+        # Patients with repeated screening rows have one record per row
+        return gap_table(processor).sort_values(['patient_id', 'gaps'], ignore_index=True)
+    pd.testing.assert_frame_equal(by_patient(incremental), by_patient(full))
+
+    def overdue_hba1c(processor):
+        gaps = gap_table(processor)
+        return set(gaps.loc[gaps['gaps'].str.contains('HbA1c test overdue'), 'patient_id'])
+    # New HbA1c results close gaps, even though time alone only opens them
+    assert overdue_hba1c(base) - overdue_hba1c(incremental)
+
+    def aggregates(processor):
+        # Gap types are counted in first-seen order, which differs once patients are appended
+        return processor.summary_aggregates().to_frame().sort_values(['dimension', 'value'], ignore_index=True)
+    pd.testing.assert_frame_equal(aggregates(incremental), aggregates(full))
+
+
+def test_incremental_run_keeps_visit_and_lab_validation(tmp_path, run_pipeline):
+    base_dir = tmp_path / 'source'
+    tables = write_dirty_dataset(base_dir)
+    write_deltas(base_dir, tables, np.random.default_rng(1))
+    state_path = str(tmp_path / 'state.pkl')
+    base = run_pipeline('base', source_dir=base_dir, as_of='2025-04-01', state_path=state_path)
+
+    incremental = HealthcareDataProcessor()
+    incremental.run_incremental(state_path, str(base_dir / 'delta_patients.csv'), str(base_dir / 'delta_visits.csv'),
+                                str(base_dir / 'delta_screenings.csv'), str(base_dir / 'delta_lab_results.csv'),
+                                as_of='2025-10-01')
+    full = run_pipeline('full', source_dir=base_dir / 'full', as_of='2025-10-01')
+
+    def counts(processor, table):
+        return {label: count for label, count in processor.data_quality_counts.items() if f'({table})' in label}
+    for table in ['visits', 'lab results']:
+        assert counts(incremental, table) == counts(full, table)
+        assert counts(incremental, table) != counts(base, table)
+    saved = pd.read_pickle(state_path)['data_quality_counts']
+    assert saved == incremental.data_quality_counts
+
+
+def test_incremental_update_rejects_as_of_before_latest_records(tmp_path, run_pipeline):
+    base_dir = tmp_path / 'source'
+    tables = write_dirty_dataset(base_dir)
+    write_deltas(base_dir, tables, np.random.default_rng(1))
+    state_path = str(tmp_path / 'state.pkl')
+    run_pipeline('base', source_dir=base_dir, as_of='2025-04-01', state_path=state_path)
+
+    incremental = HealthcareDataProcessor()
+    incremental.load_gap_state(state_path)
+    patients = incremental.patients_df
+    for as_of in ['2023-01-01', '2025-06-01']:
+        # The saved aggregates, then the delta visits, run past as_of; nothing is applied
+        with pytest.raises(ValueError, match=f'as of {as_of}'):
+            incremental.apply_deltas(str(base_dir / 'delta_patients.csv'), str(base_dir / 'delta_visits.csv'),
+                                     as_of=as_of)
+        assert incremental.patients_df is patients
@@ -0,0 +1,131 @@
+"""
+Screening rule sets: compile-time validation (GapRulePlan.compile) and gap
+types declared by the rules themselves.
+"""
+
+import copy
+
+import pandas as pd
+import pytest
+
+from conftest import gap_table
+from dirty_data import AS_OF
+from healthcare_pipeline import DEFAULT_GAP_RULES, GapRulePlan, HealthcareDataProcessor
+
+
+def rule_set(**rule):
+    return {'rules': [dict({'code': 'flu_shot', 'when': []}, **rule)]}
+
+
+def test_default_rules_compile():
+    plan = GapRulePlan.compile(copy.deepcopy(DEFAULT_GAP_RULES))
+    assert plan.codes == [rule['code'] for rule in DEFAULT_GAP_RULES['rules']]
+
+
+@pytest.mark.parametrize('gap', [
+    ['lab_out_of_target', 'HbA1c'],
+    ['lab_out_of_target', 'HbA1c', 6.5],
+    ['lab_out_of_target', 'Glucose', 110],
+])
+def test_lab_target_is_optional(gap):
+    GapRulePlan.compile(rule_set(gap=gap))
+
+
+@pytest.mark.parametrize('when, gap', [
+    ([], ['due', 'flu_shot_due', 'extra']),
+    ([], ['due']),
+    ([], ['due', 'flu_shot']),
+    ([], ['due', 'no_such_column_due']),
+    ([], ['no_visit_within', 365, 30]),
+    ([], ['no_visit_within', '365']),
+    ([], ['no_lab_within', 'HbA1c']),
+    ([], ['no_lab_within', 'HbA1c', 182.5]),
+    ([], ['no_lab_within', 'Cholesterol', 182]),
+    ([], ['lab_out_of_target', 'HbA1c', 'high']),
+    ([], ['lab_out_of_target', 'HbA1c', True]),
+    ([], ['lab_out_of_target', 'HbA1c', 7.0, 8.0]),
+    ([['min_age', '40']], ['due', 'flu_shot_due']),
+    ([['min_age', 40, 65]], ['due', 'flu_shot_due']),
+    ([['max_age']], ['due', 'flu_shot_due']),
+    ([['gender', 1]], ['due', 'flu_shot_due']),
+    ([['diagnosis', None]], ['due', 'flu_shot_due']),
+    ([['diagnosis', []]], ['due', 'flu_shot_due']),
+    ([['diagnosis', ['Asthma', 1]]], ['due', 'flu_shot_due']),
+    ([['age_over', 40]], ['due', 'flu_shot_due']),
+])
+def test_invalid_rule_terms_fail_at_compile_time(when, gap):
+    with pytest.raises(ValueError, match="Rule 'flu_shot'"):
+        GapRulePlan.compile(rule_set(when=when, gap=gap))
+
+
+def test_diagnosis_predicates_match_whole_words_or_listed_diagnoses():
+    patients = pd.DataFrame({
+        'age': [50] * 6, 'gender': ['F'] * 6,
+        'primary_diagnosis': ['Type 2 Diabetes', 'type 1 diabetes', 'Prediabetes', 'Diabetes insipidus',
+                              'Hypertension', None],
+    })
+    default = GapRulePlan.compile(copy.deepcopy(DEFAULT_GAP_RULES))
+    eye_exam = default.eligible(patients)[:, default.codes.index('diabetic_eye_exam')]
+    assert eye_exam.tolist() == [True, True, False, False, False, False]
+
+    word = GapRulePlan.compile(rule_set(when=[['diagnosis', 'diabetes']], gap=['due', 'flu_shot_due']))
+    assert word.eligible(patients)[:, 0].tolist() == [True, True, False, True, False, False]
+
+
+def asthma_rule_set():
+    rules = copy.deepcopy(DEFAULT_GAP_RULES)
+    rules['rules'].append({'code': 'asthma_review', 'label': 'Asthma review overdue', 'weight': 2,
+                           'when': [['diagnosis', 'asthma']], 'gap': ['no_visit_within', 180]})
+    return rules
+
+
+def test_new_gap_type_runs_through_the_pipeline(run_pipeline):
+    plan = GapRulePlan.compile(asthma_rule_set())
+    assert plan.gap_types[-1] == ('asthma_review', 'Asthma review overdue', 2)
+    processor = run_pipeline('asthma', processor=HealthcareDataProcessor(plan))
+
+    records = processor.care_gaps.records(processor.patients_df)
+    assert any('Asthma review overdue' in record['gaps'] for record in records)
+    with open('care_gaps_report.csv') as f:
+        assert 'Asthma review overdue' in f.read()
+    assert 'Asthma review overdue' in processor.summary_aggregates().gap_types
+
+    cube = processor.backtest_care_gaps([AS_OF])
+    assert cube.gap_counts().loc[pd.Timestamp(AS_OF), 'Asthma review overdue'] > 0
+    pd.testing.assert_frame_equal(gap_table(processor, cube.store(AS_OF)), gap_table(processor))
+
+
+def test_rules_can_relabel_known_gap_types():
+    rules = rule_set(gap=['due', 'flu_shot_due'], label='Influenza vaccine due')
+    assert GapRulePlan.compile(rules).gap_types == [('flu_shot', 'Influenza vaccine due', 1)]
+
+
+@pytest.mark.parametrize('rule', [
+    {'code': 'asthma_review', 'weight': 2},
+    {'code': 'asthma_review', 'label': 'Asthma review overdue'},
+])
+def test_new_gap_types_need_a_label_and_weight(rule):
+    with pytest.raises(ValueError, match='label and a weight'):
+        GapRulePlan.compile({'rules': [dict(rule, when=[], gap=['no_visit_within', 180])]})
+
+
+@pytest.mark.parametrize('definition, message', [
+    ({'senior_age': '65'}, 'senior_age'),
+    ({'senior_age': True}, 'senior_age'),
+    ({'senior_age': 65.5}, 'senior_age'),
+    (rule_set(weight='3', gap=['due', 'flu_shot_due']), 'weight'),
+    (rule_set(weight=True, gap=['due', 'flu_shot_due']), 'weight'),
+    (rule_set(label=None, gap=['due', 'flu_shot_due']), 'label'),
+])
+def test_invalid_rule_set_settings_fail_at_compile_time(definition, message):
+    definition = dict(copy.deepcopy(DEFAULT_GAP_RULES), **definition)
+    with pytest.raises(ValueError, match=message):
+        GapRulePlan.compile(definition)
+
+
+def test_rule_sets_are_limited_to_the_gap_mask_width():
+    rules = [{'code': f'guideline_{i}', 'label': f'Guideline {i}', 'weight': 1, 'when': [],
+              'gap': ['no_visit_within', 365]} for i in range(GapRulePlan.MAX_RULES + 1)]
+    GapRulePlan.compile({'rules': rules[:-1]})
+    with pytest.raises(ValueError, match='at most 32 rules'):
+        GapRulePlan.compile({'rules': rules})